@@ -0,0 +1,149 @@
+# app/actionqueue.py
+import time
+import heapq
+import random
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Defaults for [scheduler] in manager_settings.toml
+MAX_CONCURRENT = 4
+JITTER_SECONDS = 0
+
+
+class JobStats:
+    """Lateness/duration counters for one scheduled job."""
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run: Optional[float] = None
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    def as_dict(self) -> dict:
+        n = self.runs or 1
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "lateness": {"last": round(self.last_lateness, 3), "max": round(self.max_lateness, 3),
+                         "avg": round(self.total_lateness / n, 3)},
+            "duration": {"last": round(self.last_duration, 3), "max": round(self.max_duration, 3),
+                         "avg": round(self.total_duration / n, 3)},
+        }
+
+
+class _Item:
+    def __init__(self, job_id: str, fn: Callable[[], None], priority: int, due: float):
+        self.job_id = job_id
+        self.fn = fn
+        self.priority = priority
+        self.due = due
+        self.cancelled = False
+
+
+class ActionQueue:
+    """Runs scheduled lifecycle actions with jitter and a concurrency cap.
+
+    A cron trigger only enqueues its action. Each action waits out a random
+    delay inside its jitter window, then joins the ready queue; a fixed
+    pool of max_concurrent workers takes the highest priority first (FIFO
+    within a priority). A job that fires again while its previous run is
+    still queued is skipped rather than stacked.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+        self._delayed: List[tuple] = []  # (due, seq, item)
+        self._ready: List[tuple] = []    # (-priority, due, seq, item)
+        self._queued: Dict[str, _Item] = {}
+        self.running = 0
+        self.stats: Dict[str, JobStats] = {}
+        for i in range(self.max_concurrent):
+            threading.Thread(target=self._worker, name=f"action-worker-{i}", daemon=True).start()
+
+    def submit(self, job_id: str, fn: Callable[[], None], priority: int = 0, jitter: float = 0.0):
+        delay = random.uniform(0, jitter) if jitter > 0 else 0.0
+        item = _Item(job_id, fn, priority, time.time() + delay)
+        with self._cv:
+            st = self.stats.setdefault(job_id, JobStats())
+            if job_id in self._queued:
+                st.skipped += 1
+                return
+            self._queued[job_id] = item
+            if delay:
+                heapq.heappush(self._delayed, (item.due, next(self._seq), item))
+            else:
+                heapq.heappush(self._ready, (-priority, item.due, next(self._seq), item))
+            self._cv.notify()
+
+    def cancel(self, job_id: str):
+        """Drop a queued run and the job's stats (its schedule was removed)."""
+        with self._cv:
+            item = self._queued.pop(job_id, None)
+            if item is not None:
+                item.cancelled = True
+            self.stats.pop(job_id, None)
+
+    def _next(self) -> _Item:
+        # caller holds self._cv
+        while True:
+            now = time.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, item = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (-item.priority, item.due, seq, item))
+            while self._ready:
+                item = heapq.heappop(self._ready)[-1]
+                if not item.cancelled:
+                    return item
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._cv.wait(timeout)
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                item = self._next()
+                self._queued.pop(item.job_id, None)
+                self.running += 1
+            started = time.time()
+            ok = True
+            try:
+                item.fn()
+            except Exception as e:
+                ok = False
+                print(f"Scheduled action {item.job_id} failed: {e}")
+            finished = time.time()
+            with self._cv:
+                self.running -= 1
+                st = self.stats.get(item.job_id)
+                if st is None:
+                    continue
+                lateness = max(0.0, started - item.due)
+                duration = finished - started
+                st.runs += 1
+                st.failures += 0 if ok else 1
+                st.last_run = started
+                st.last_lateness = lateness
+                st.max_lateness = max(st.max_lateness, lateness)
+                st.total_lateness += lateness
+                st.last_duration = duration
+                st.max_duration = max(st.max_duration, duration)
+                st.total_duration += duration
+
+    def snapshot(self) -> dict:
+        with self._cv:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self.running,
+                "queued": len(self._queued),
+                "jobs": {job_id: st.as_dict() for job_id, st in self.stats.items()},
+            }
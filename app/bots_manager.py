@@ -1,20 +1,41 @@
 # app/bots_manager.py
 import os
+import copy
 import json
+import hashlib
 import signal
 import shutil
+import socket
 import psutil
 import tomli
 import tomli_w
+import threading
 import subprocess
 from pathlib import Path
-from typing import Dict, Optional, List
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional, List
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.executors.pool import ThreadPoolExecutor
 
 from .schemas import BotConfig, ScheduleItem
-from .utils import assure_dir
+from .utils import assure_dir, atomic_write
+from .configwrite import schema_for
+from .supervisor import ProcessSupervisor
+from .logstore import SegmentedLog, LogPump, ROTATE_MAX_BYTES, ROTATE_MAX_AGE, KEEP_SEGMENTS
+from .tailer import LineRing
+from .zygote import Zygote
+from .journal import StateJournal, same_process
+from .restarts import RestartPolicyEngine
+from .cgroups import CgroupManager, CGROUP_ROOT, PARENT as CGROUP_PARENT
+from .timeseries import MetricsHistory
+from . import provision
+from .templatestore import TemplateStore
+from .cluster import shard_of
+from .actionqueue import ActionQueue, MAX_CONCURRENT, JITTER_SECONDS
+from . import logread
 
 ROOT = Path(__file__).resolve().parent.parent
 
@@ -24,20 +45,162 @@ INSTANCES_DIR = Path(os.environ.get("BOTS_ROOT", "/data/bots"))
 
 DISCUM_TEMPLATE = TEMPLATES_DIR / "discum_selfbot"
 
+# Lifecycle journal; boot restores every bot from here
+JOURNAL_PATH = Path(os.environ.get("STATE_JOURNAL", str(INSTANCES_DIR / "state.sqlite")))
+
+# Content-addressed template versions that instances link to
+TEMPLATE_STORE = Path(os.environ.get("TEMPLATE_STORE", str(INSTANCES_DIR / ".templates")))
+
+# Recorded with each start so only a worker on the same host re-adopts the PID
+HOST = socket.gethostname()
+
+# Seconds between SIGTERM and SIGKILL when stopping a bot
+STOP_TIMEOUT = 10.0
+
+# Threads that fire schedule triggers; the actions run on the ActionQueue
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "32"))
+
+def _file_size(path) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _create_time(pid: int) -> Optional[float]:
+    try:
+        return psutil.Process(pid).create_time()
+    except Exception:
+        return None
+
+
+class LaunchContext:
+    """Per-launch inputs for start()/restart().
+
+    Passed explicitly instead of going through os.environ, so launches on
+    different threads cannot see each other's command.
+    """
+
+    def __init__(self, command: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                 args: Optional[List[str]] = None):
+        self.command = command
+        self.env = env or {}
+        self.args = args or []
+
+
+def _schedule_key(sch: ScheduleItem) -> str:
+    # Everything that changes when or how the job runs; the name does not
+    spec = json.dumps([sch.action, sch.cron, sch.every_seconds, sch.custom_cmd,
+                       sch.jitter_seconds, sch.priority])
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()[:12]
+
+
+class ConfigStore:
+    """Parsed config.toml files, re-read only when the file changes.
+
+    Entries are keyed by path and validated against (inode, size, mtime)
+    on every lookup, so edits made outside the manager are still picked
+    up; a stat() is all a cache hit costs. Returned dicts are shared:
+    treat them as read-only. Writers call invalidate() after replacing
+    a file (see ConfigWriter).
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, path) -> dict:
+        path = str(path)
+        try:
+            st = os.stat(path)
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            key = None
+        with self._lock:
+            e = self._entries.get(path)
+            if e is not None and e["key"] == key:
+                self.hits += 1
+                return e
+            self.misses += 1
+        data = {}
+        if key is not None:
+            with open(path, "rb") as f:
+                data = tomli.load(f)
+        e = {"key": key, "data": data, "derived": {}}
+        with self._lock:
+            self._entries[path] = e
+        return e
+
+    def load(self, path) -> dict:
+        return self._entry(path)["data"]
+
+    def _derived(self, path, name: str, fn):
+        e = self._entry(path)
+        d = e["derived"]
+        if name not in d:
+            d[name] = fn(e["data"])
+        return d[name]
+
+    def bot_config(self, path) -> BotConfig:
+        return self._derived(path, "bot_config", lambda data: BotConfig(**data))
+
+    def display_name(self, path, default: str) -> str:
+        try:
+            return self._derived(path, "name", lambda data: data.get("persona", {}).get("name")) or default
+        except Exception:
+            return default
+
+    def labels(self, path) -> dict:
+        try:
+            return self._derived(path, "labels", lambda data: data.get("labels", {}))
+        except Exception:
+            return {}
+
+    def schedules(self, path) -> List[ScheduleItem]:
+        return self.bot_config(path).schedules
+
+    def schema(self, path) -> dict:
+        """Editor schema for the file as it is now."""
+        return self._derived(path, "schema", schema_for)
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(str(path), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
 class BotProc:
     def __init__(self, bot_id: str, path: Path):
         self.bot_id = bot_id
         self.path = path
-        self.proc: Optional[subprocess.Popen] = None
+        self.proc: Optional[subprocess.Popen] = None  # or a ZygoteChild in zygote mode
+        self.log: Optional[SegmentedLog] = None
+        self.ring: Optional[LineRing] = None
         self.logfile = self.path / "logs" / "bot.log"
         self.status = "stopped"
         self.started_at: Optional[datetime] = None
         self.last_exit: Optional[int] = None
         self.pid: Optional[int] = None
+        # number of times the manager has launched this bot
+        self.starts = 0
+        # set by request_stop so the exit is not treated as a crash
+        self.stop_requested = False
+        # context of the last launch; automatic restarts reuse it
+        self.launch: Optional["LaunchContext"] = None
+        # stored template version the code links to; None for a private copy
+        self.version: Optional[str] = None
+        # set whenever no process is attached; stop() waits on it
+        self.exited = threading.Event()
+        self.exited.set()
 
     def is_running(self) -> bool:
-        if self.proc is not None and self.proc.poll() is None:
-            return True
+        if self.proc is not None:
+            return self.proc.poll() is None
         if self.pid:
             try:
                 p = psutil.Process(self.pid)
@@ -48,9 +211,33 @@ class BotProc:
 
 
 class BotRegistry:
-    def __init__(self):
-        self.bots: Dict[str, BotProc] = {}
-        self.scheduler = BackgroundScheduler(daemon=True)
+    def __init__(self, settings: Optional[dict] = None):
+        # manager_settings.toml contents (shared, may be edited at runtime)
+        self.settings = settings if settings is not None else {}
+        # bot_id -> BotProc. Never changed in place: adding or removing a
+        # bot publishes a new read-only dict, so readers take whichever one
+        # is current and iterate it without locking (copy-on-write)
+        self.bots: Mapping[str, BotProc] = MappingProxyType({})
+        self.generation = 0
+        self._bots_lock = threading.Lock()
+        # one writer at a time per bot; different bots proceed in parallel
+        self._bot_locks: Dict[str, threading.RLock] = {}
+        # environment every bot starts from; per-launch values go on top
+        self.base_env = os.environ.copy()
+        self.configs = ConfigStore()
+        self._exit_lock = threading.Lock()
+        # callables (bot_id, state, info) notified on lifecycle transitions:
+        # starting, running, stopping, exited
+        self.listeners: List[Callable[[str, str, dict], None]] = []
+        # Jobs carry their own LaunchContext, so they can run side by side
+        self.scheduler = BackgroundScheduler(
+            daemon=True, executors={"default": ThreadPoolExecutor(SCHEDULER_WORKERS)})
+        # bot_id -> IDs of its scheduler jobs, so edits never scan get_jobs()
+        self._jobs: Dict[str, set] = {}
+        self._sched_lock = threading.Lock()
+        # cron/interval jobs only enqueue; this runs them, capped and jittered
+        self.actions = ActionQueue(
+            self.settings.get("scheduler", {}).get("max_concurrent", MAX_CONCURRENT))
         self.scheduler.start()
 
         # Ensure dirs exist
@@ -61,204 +248,573 @@ class BotRegistry:
         if not (DISCUM_TEMPLATE / "bot.py").exists():
             raise FileNotFoundError(f"Template missing: {DISCUM_TEMPLATE}/bot.py")
 
+        self.templates = TemplateStore(TEMPLATE_STORE)
+        # with [cluster] enabled a ClusterNode attaches itself here, and
+        # running bots are only adopted once their shard is leased
+        self.cluster = None
+        self.clustered = bool(self.settings.get("cluster", {}).get("enabled", False))
+        self.journal = StateJournal(str(JOURNAL_PATH))
         self._discover()
+        # journal position sync() continues from
+        self._seq = self.journal.last_seq()
+        # warm pre-forked interpreter, created on first use when
+        # [launch] zygote is enabled
+        self.zygote: Optional[Zygote] = None
+        # starts of different bots run in parallel; only one may create it
+        self._zygote_lock = threading.Lock()
+        cg = self.settings.get("cgroups", {})
+        self.cgroups = CgroupManager(cg.get("root", CGROUP_ROOT), cg.get("parent", CGROUP_PARENT),
+                                     enabled=cg.get("enabled", False))
+        self.pump = LogPump()
+        for b in self.bots.values():
+            if b.pid:
+                # adopted: still appending to its log, follow it again
+                self._follow_log(b)
+        self.restarts = RestartPolicyEngine(self)
+        self.history = MetricsHistory(self)
+        self.supervisor = ProcessSupervisor(self)
 
     def _discover(self):
+        if self.journal.initialized:
+            self._recover()
+            return
+        # First boot with a journal: import what is on disk once
+        found = {}
         for p in INSTANCES_DIR.glob("bot_*"):
             if (p / "bot.py").exists():
                 bot_id = p.name
                 bp = BotProc(bot_id, p)
+                bp.version = provision.instance_version(p)
+                self.journal.record(bot_id, "created", path=str(p), version=bp.version)
                 # If a stale PID file exists, pick it up
                 pidfile = p / "run.pid"
                 if pidfile.exists():
                     try:
-                        bp.pid = int(pidfile.read_text().strip())
+                        pid = int(pidfile.read_text().strip())
+                        # no start time was recorded: check it is this bot
+                        if same_process(pid, None, str(p)):
+                            # in a cluster the shard's owner adopts it
+                            if not self.clustered:
+                                bp.pid = pid
+                                bp.exited.clear()
+                            self.journal.record(bot_id, "started", pid=pid, create_time=_create_time(pid),
+                                                started_at=None, host=HOST)
                     except Exception:
                         pass
-                self.bots[bot_id] = bp
+                found[bot_id] = bp
+        self._update_bots(found)
+        self.journal.mark_initialized()
+
+    def _recover(self):
+        state = self.journal.replay()
+        found = {}
+        for bot_id in sorted(state, key=lambda k: (len(k), k)):
+            st = state[bot_id]
+            if not st["path"]:
+                continue
+            bp = BotProc(bot_id, Path(st["path"]))
+            bp.last_exit = st["last_exit"]
+            bp.starts = st["starts"]
+            bp.version = st.get("version")
+            if st["started_at"]:
+                bp.started_at = datetime.fromisoformat(st["started_at"])
+            if st["pid"] and not self.clustered:
+                # the PID only counts if it is still the process we started
+                if same_process(st["pid"], st["create_time"], st["path"]):
+                    bp.pid = st["pid"]
+                    bp.exited.clear()
+                else:
+                    self.journal.record(bot_id, "exited", code=None)
+            found[bot_id] = bp
+        self._update_bots(found)
 
     def create_from_template(self, name: str) -> str:
-        idx = 1
-        while True:
-            candidate = f"bot_{idx}"
-            dest = INSTANCES_DIR / candidate
-            if candidate not in self.bots and not dest.exists():
-                break
-            idx += 1
-
-        shutil.copytree(DISCUM_TEMPLATE, dest)
-        assure_dir(dest / "logs")
-
-        # personalize config name (tolerant if persona missing)
-        cfg_path = dest / "config.toml"
-        if cfg_path.exists():
-            with open(cfg_path, "rb") as f:
-                cfg = tomli.load(f)
-            persona = cfg.get("persona", {})
-            persona["name"] = name
-            cfg["persona"] = persona
-            with open(cfg_path, "wb") as f:
-                tomli_w.dump(cfg, f)
-
-        self.bots[candidate] = BotProc(candidate, dest)
-        self._apply_schedules(candidate)
-        return candidate
+        return self.create_many([name])[0]
+
+    def create_many(self, names: List[str]) -> List[str]:
+        """Provision one instance per name; returns the new bot IDs.
+
+        IDs come from a counter in the journal rather than probing
+        bot_1, bot_2, ... on disk. Template code is copied or linked as
+        [provision] mode says; config.toml is always the bot's own. In
+        versioned mode the template is snapshotted into the store first
+        and the bots link to that version. All or nothing: if one bot
+        fails, the directories made so far are removed again.
+        """
+        mode = self.settings.get("provision", {}).get("mode", provision.MODE)
+        version = None
+        src = DISCUM_TEMPLATE
+        if mode == "versioned":
+            version = self.templates.snapshot(DISCUM_TEMPLATE)
+            src = self.templates.path(version)
+            layout = self.templates.layout(version)
+        else:
+            layout = provision.template_files(DISCUM_TEMPLATE)
+        tpl_cfg = DISCUM_TEMPLATE / "config.toml"
+        base_cfg = self.configs.load(tpl_cfg) if tpl_cfg.exists() else None
+
+        floor = 1 + max((int(b[4:]) for b in self.bots if b[4:].isdigit()), default=0)
+        n = self.journal.allocate("next_bot_id", len(names), floor)
+        ids, events, new, made = [], [], {}, []
+        try:
+            for name in names:
+                while True:
+                    candidate = f"bot_{n}"
+                    dest = INSTANCES_DIR / candidate
+                    n += 1
+                    try:
+                        os.mkdir(dest)
+                        break
+                    except FileExistsError:
+                        # left over from outside the manager; skip the number
+                        continue
+                made.append(dest)
+                provision.populate(src, dest, layout, mode)
+                assure_dir(dest / "logs")
+
+                # personalize config name (tolerant if persona missing)
+                if base_cfg is not None:
+                    cfg = copy.deepcopy(base_cfg)
+                    persona = cfg.get("persona", {})
+                    persona["name"] = name
+                    cfg["persona"] = persona
+                    atomic_write(dest / "config.toml", tomli_w.dumps(cfg).encode("utf-8"))
+
+                bp = BotProc(candidate, dest)
+                bp.version = version
+                new[candidate] = bp
+                events.append((candidate, "created", {"path": str(dest), "version": version}))
+                ids.append(candidate)
+            # numbers skipped over stray directories are used up too
+            self.journal.allocate("next_bot_id", 0, n)
+            self.journal.record_many(events)
+        except BaseException:
+            # all or nothing: nothing was journaled or published yet
+            for dest in made:
+                shutil.rmtree(dest, ignore_errors=True)
+                self.configs.invalidate(dest / "config.toml")
+            raise
+        self._update_bots(new)
+        for bot_id in ids:
+            self._apply_schedules(bot_id)
+            self.supervisor.refresh(bot_id)
+        return ids
+
+    def set_version(self, bot_id: str, version: str) -> Optional[str]:
+        """Link the bot's code to a stored template version; returns the old one.
+
+        A running bot keeps the code it loaded until it is restarted.
+        """
+        with self.lock(bot_id):
+            b = self._get(bot_id)
+            layout = self.templates.layout(version)
+            old = b.version
+            old_files = self.templates.layout(old)[1] if old and self.templates.exists(old) else ()
+            provision.link_version(self.templates.path(version), b.path, layout, old_files)
+            b.version = version
+            self.journal.record(bot_id, "upgraded", version=version)
+            self.supervisor.refresh(bot_id)
+            return old
 
     def delete(self, bot_id: str):
+        with self.lock(bot_id):
+            b = self._get(bot_id)
+            if b.is_running():
+                raise RuntimeError("Stop the bot before deleting")
+            shutil.rmtree(b.path, ignore_errors=True)
+            # remove its schedules
+            self._reconcile_schedules(bot_id, [])
+            self._update_bots(remove=[bot_id])
+            self.restarts.forget(bot_id)
+            self.history.forget(bot_id)
+            self.journal.record(bot_id, "deleted")
+            if self.cluster is not None:
+                self.cluster.store.forget(bot_id)
+            self.supervisor.refresh(bot_id)
+        # IDs are never reused
+        self._bot_locks.pop(bot_id, None)
+
+    def start(self, bot_id: str, ctx: Optional[LaunchContext] = None):
+        with self.lock(bot_id):
+            b = self._get(bot_id)
+            if b.is_running():
+                return
+            ctx = ctx or LaunchContext()
+            b.launch = ctx
+            assure_dir(b.path / "logs")
+            env = dict(self.base_env)
+            env.update(ctx.env)
+            env["BOT_ID"] = bot_id
+            if ctx.command is not None:
+                env["BOT_COMMAND"] = ctx.command
+            else:
+                env.setdefault("BOT_COMMAND", "")
+
+            offset = _file_size(b.logfile)
+            b.stop_requested = False
+            b.status = "starting"
+            self._emit(bot_id, "starting")
+            try:
+                proc = self._spawn(b, ["python", "bot.py"] + ctx.args, env)
+            except Exception as e:
+                b.status = "stopped"
+                self._emit(bot_id, "exited", error=str(e))
+                raise
+            b.exited.clear()
+            b.proc = proc
+            # from where this run's output starts
+            self._follow_log(b, offset)
+            b.pid = proc.pid
+            self.cgroups.place(bot_id, b.pid, self.limits(bot_id))
+            (b.path / "run.pid").write_text(str(b.pid))
+            b.status = "running"
+            b.started_at = datetime.utcnow()
+            b.last_exit = None
+            b.starts += 1
+            self.journal.record(bot_id, "started", pid=b.pid, create_time=_create_time(b.pid),
+                                started_at=b.started_at.isoformat(), host=HOST)
+            self.supervisor.refresh(bot_id)
+            self._emit(bot_id, "running", pid=b.pid)
+
+    def limits(self, bot_id: str) -> dict:
+        """cgroup limits: the bot's [limits] table over [cgroups] defaults."""
+        base = self.settings.get("cgroups", {})
+        own = self.configs.load(self.config_path(bot_id)).get("limits", {})
+        keys = ("cpu_weight", "cpu_max", "memory_max", "pids_max")
+        return {k: own.get(k, base.get(k)) for k in keys}
+
+    def _spawn(self, b: BotProc, argv: List[str], env: Dict[str, str]):
+        # The bot appends to its log itself, so it keeps running and
+        # logging while no manager is reading; the pump follows the file
+        out = os.open(b.logfile, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            if self.settings.get("launch", {}).get("zygote", False):
+                try:
+                    with self._zygote_lock:
+                        if self.zygote is None:
+                            self.zygote = Zygote(DISCUM_TEMPLATE)
+                    return self.zygote.spawn(argv, b.path, env, out)
+                except Exception as e:
+                    print(f"Zygote spawn failed for {b.bot_id}, starting cold: {e}")
+            return subprocess.Popen(
+                argv,
+                cwd=b.path,
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                env=env
+            )
+        finally:
+            os.close(out)
+
+    def request_stop(self, bot_id: str, timeout: float = STOP_TIMEOUT) -> bool:
+        """Send SIGTERM and return at once; the supervisor escalates to
+        SIGKILL after `timeout` seconds. False if the bot was not running."""
+        with self.lock(bot_id):
+            b = self._get(bot_id)
+            if not b.is_running():
+                b.status = "stopped"
+                return False
+            b.status = "stopping"
+            b.stop_requested = True
+            self._emit(bot_id, "stopping", pid=b.pid)
+            self._signal(b, signal.SIGTERM)
+            self.supervisor.escalate(bot_id, timeout)
+            self.supervisor.refresh(bot_id)
+            return True
+
+    def stop(self, bot_id: str, timeout: float = STOP_TIMEOUT):
+        """Blocking stop, for callers that are already on a worker thread.
+
+        The writer lock is only held while the signal goes out, not for
+        the wait.
+        """
         b = self._get(bot_id)
-        if b.is_running():
-            raise RuntimeError("Stop the bot before deleting")
-        shutil.rmtree(b.path, ignore_errors=True)
-        # remove its schedules
-        for job in list(self.scheduler.get_jobs()):
-            if job.id.startswith(f"{bot_id}:"):
-                self.scheduler.remove_job(job.id)
-        self.bots.pop(bot_id, None)
-
-    def start(self, bot_id: str):
-        b = self._get(bot_id)
-        if b.is_running():
-            return
-        assure_dir(b.path / "logs")
-        env = os.environ.copy()
-        env["BOT_ID"] = bot_id
-        env["BOT_COMMAND"] = env.get("BOT_COMMAND", "")
-
-        # Open log file line-buffered for smooth tailing
-        logfh = open(b.logfile, "a", encoding="utf-8", buffering=1)
-        # Spawn process
-        b.proc = subprocess.Popen(
-            ["python", "bot.py"],
-            cwd=b.path,
-            stdout=logfh,
-            stderr=subprocess.STDOUT,
-            env=env
-        )
-        b.pid = b.proc.pid
-        (b.path / "run.pid").write_text(str(b.pid))
-        b.status = "running"
-        b.started_at = datetime.utcnow()
-        b.last_exit = None
-
-    def stop(self, bot_id: str):
-        b = self._get(bot_id)
-        if not b.is_running():
-            b.status = "stopped"
+        if not self.request_stop(bot_id, timeout):
             return
+        if not b.exited.wait(timeout + 5):
+            print(f"Bot {bot_id} did not exit after SIGKILL")
+
+    def _signal(self, b: BotProc, sig: int):
+        proc = b.proc
         try:
-            if b.proc and b.proc.poll() is None:
-                b.proc.send_signal(signal.SIGTERM)
-                b.proc.wait(timeout=10)
+            if proc is not None:
+                if proc.poll() is None:
+                    proc.send_signal(sig)
             elif b.pid:
-                os.kill(b.pid, signal.SIGTERM)
-        except Exception:
+                os.kill(b.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _kill(self, b: BotProc):
+        # Called by the supervisor once the SIGTERM grace period is over
+        print(f"Bot {b.bot_id} ignored SIGTERM, sending SIGKILL")
+        self._signal(b, signal.SIGKILL)
+
+    def _on_exit(self, b: BotProc, code: Optional[int], proc):
+        # Called by the supervisor when it reaps the child (or notices an
+        # adopted PID is gone); only the first report for a process counts.
+        with self._exit_lock:
+            if b.proc is not proc or (proc is None and not b.pid):
+                return
+            b.last_exit = code
+            b.proc = None
+            b.pid = None
             try:
-                if b.proc and b.proc.poll() is None:
-                    b.proc.kill()
-                elif b.pid:
-                    os.kill(b.pid, signal.SIGKILL)
+                (b.path / "run.pid").unlink(missing_ok=True)
             except Exception:
                 pass
-        if b.proc:
-            b.last_exit = b.proc.returncode
-        b.proc = None
-        b.pid = None
-        try:
-            (b.path / "run.pid").unlink(missing_ok=True)
-        except Exception:
-            pass
-        b.status = "stopped"
-
-    def restart(self, bot_id: str):
+            b.status = "stopped"
+        self.journal.record(b.bot_id, "exited", code=code)
+        self.pump.detach(b.bot_id)
+        self.cgroups.release(b.bot_id)
+        self.supervisor.clear_escalation(b.bot_id)
+        self.supervisor.refresh(b.bot_id)
+        b.exited.set()
+        uptime = None
+        if b.started_at is not None:
+            uptime = round((datetime.utcnow() - b.started_at).total_seconds(), 3)
+        self._emit(b.bot_id, "exited", code=code, requested=b.stop_requested, uptime=uptime)
+        # after the exit went out, so a backoff event follows it
+        self.restarts.on_exit(b.bot_id, code, b.stop_requested, uptime)
+
+    def add_listener(self, fn: Callable[[str, str, dict], None]):
+        self.listeners.append(fn)
+
+    def _emit(self, bot_id: str, state: str, **info):
+        for fn in list(self.listeners):
+            try:
+                fn(bot_id, state, info)
+            except Exception as e:
+                print(f"Lifecycle listener error: {e}")
+
+    def _segmented_log(self, b: BotProc) -> SegmentedLog:
+        logs = self.settings.get("logs", {})
+        max_bytes = logs.get("rotate_max_bytes", ROTATE_MAX_BYTES)
+        max_age = logs.get("rotate_max_age", ROTATE_MAX_AGE)
+        keep = logs.get("keep_segments", KEEP_SEGMENTS)
+        if b.log is None:
+            b.log = SegmentedLog(str(b.logfile), max_bytes, max_age, keep)
+        else:
+            b.log.configure(max_bytes, max_age, keep)
+        return b.log
+
+    def _follow_log(self, b: BotProc, offset: Optional[int] = None):
+        """Have the pump feed the bot's log into its ring (and rotate it).
+
+        Without an offset (an adopted bot) it continues from the end of
+        what is on disk now.
+        """
+        ring = self.log_ring(b.bot_id)
+        if offset is None:
+            offset = _file_size(b.logfile)
+        self.pump.attach(b.bot_id, self._segmented_log(b), offset,
+                         listeners=[ring.feed_bytes], on_eof=ring.flush)
+
+    def log_ring(self, bot_id: str) -> LineRing:
+        """The bot's recent-output buffer, seeded from disk the first time."""
+        b = self._get(bot_id)
+        max_lines = self.settings.get("logs", {}).get("max_lines", 1000)
+        if b.ring is None:
+            b.ring = LineRing(max_lines)
+        else:
+            b.ring.resize(max_lines)
+        if not b.ring.seeded:
+            try:
+                lines, _start, _end = logread.read_tail(str(b.logfile), max_lines)
+            except OSError:
+                lines = []
+            b.ring.seed(lines)
+        return b.ring
+
+    def restart(self, bot_id: str, ctx: Optional[LaunchContext] = None):
+        # stop() and start() each take the writer lock; holding it across
+        # the wait for the exit would block every other writer of the bot
         self.stop(bot_id)
-        self.start(bot_id)
+        self.start(bot_id, ctx)
 
     def config_path(self, bot_id: str) -> Path:
         return self._get(bot_id).path / "config.toml"
 
     def read_config(self, bot_id: str) -> BotConfig:
-        cfg_path = self.config_path(bot_id)
-        raw = {}
-        if cfg_path.exists():
-            with open(cfg_path, "rb") as f:
-                raw = tomli.load(f)
-        return BotConfig(**raw)
-
-    def write_config(self, bot_id: str, cfg: BotConfig):
-        with open(self.config_path(bot_id), "wb") as f:
-            tomli_w.dump(json.loads(cfg.json(by_alias=True)), f)
-        self._apply_schedules(bot_id)
+        return self.configs.bot_config(self.config_path(bot_id))
 
     def _apply_schedules(self, bot_id: str):
-        for job in list(self.scheduler.get_jobs()):
-            if job.id.startswith(f"{bot_id}:"):
-                self.scheduler.remove_job(job.id)
-        cfg = self.read_config(bot_id)
-        for i, sch in enumerate(cfg.schedules):
-            self._add_schedule(bot_id, i, sch)
+        if not self.owns(bot_id):
+            # the owning worker schedules it; have it re-read the config
+            self.cluster.send(bot_id, "reload")
+            return
+        self._reconcile_schedules(bot_id, self.configs.schedules(self.config_path(bot_id)))
+
+    def _reconcile_schedules(self, bot_id: str, schedules: List[ScheduleItem]):
+        """Bring the bot's scheduler jobs in line with `schedules`.
+
+        Job IDs are derived from what a schedule does, not where it sits
+        in the list, so only added, removed or edited entries touch the
+        scheduler; reordering or renaming touches nothing.
+        """
+        desired: Dict[str, ScheduleItem] = {}
+        for sch in schedules:
+            base = f"{bot_id}:{_schedule_key(sch)}"
+            job_id, n = base, 1
+            while job_id in desired:
+                # identical entries each get their own job
+                n += 1
+                job_id = f"{base}#{n}"
+            desired[job_id] = sch
+        with self._sched_lock:
+            current = self._jobs.setdefault(bot_id, set())
+            for job_id in current - desired.keys():
+                try:
+                    self.scheduler.remove_job(job_id)
+                except JobLookupError:
+                    pass
+                self.actions.cancel(job_id)
+                current.discard(job_id)
+            for job_id in desired.keys() - current:
+                self._add_schedule(bot_id, job_id, desired[job_id])
+                current.add(job_id)
+            if not current:
+                self._jobs.pop(bot_id, None)
 
-    def _add_schedule(self, bot_id: str, idx: int, sch: ScheduleItem):
-        job_id = f"{bot_id}:{idx}"
+    def _add_schedule(self, bot_id: str, job_id: str, sch: ScheduleItem):
 
         def do_action():
-            os.environ["BOT_COMMAND"] = sch.custom_cmd or ""
+            ctx = LaunchContext(command=sch.custom_cmd or "")
             if sch.action == "start":
-                self.start(bot_id)
+                self.start(bot_id, ctx)
             elif sch.action == "stop":
                 self.stop(bot_id)
             elif sch.action == "restart":
-                self.restart(bot_id)
+                self.restart(bot_id, ctx)
             elif sch.action == "custom":
                 # By convention, restart to pick up custom command
-                self.restart(bot_id)
+                self.restart(bot_id, ctx)
+
+        def enqueue():
+            jitter = sch.jitter_seconds
+            if jitter is None:
+                jitter = self.settings.get("scheduler", {}).get("jitter_seconds", JITTER_SECONDS)
+            self.actions.submit(job_id, do_action, sch.priority, jitter)
 
         if sch.cron:
             trig = CronTrigger.from_crontab(sch.cron)
-            self.scheduler.add_job(do_action, trig, id=job_id, replace_existing=True)
+            self.scheduler.add_job(enqueue, trig, id=job_id, replace_existing=True)
         else:
             every = sch.every_seconds if sch.every_seconds else 3600
-            self.scheduler.add_job(do_action, "interval", seconds=every, id=job_id, replace_existing=True)
+            self.scheduler.add_job(enqueue, "interval", seconds=every, id=job_id, replace_existing=True)
+
+    def _update_bots(self, add: Optional[Dict[str, BotProc]] = None, remove=()):
+        """Publish a new bots map with `add` merged in and `remove` left out."""
+        with self._bots_lock:
+            new = dict(self.bots)
+            new.update(add or {})
+            for bot_id in remove:
+                new.pop(bot_id, None)
+            self.bots = MappingProxyType(new)
+            self.generation += 1
+
+    def lock(self, bot_id: str) -> threading.RLock:
+        """Writer lock of one bot, held while its process or files change."""
+        lk = self._bot_locks.get(bot_id)
+        if lk is None:
+            lk = self._bot_locks.setdefault(bot_id, threading.RLock())
+        return lk
 
     def _get(self, bot_id: str) -> BotProc:
         if bot_id not in self.bots:
             raise FileNotFoundError(bot_id)
         return self.bots[bot_id]
 
-    def snapshot(self) -> List[dict]:
-        items = []
-        for bot_id, b in self.bots.items():
-            # Normalize running status from actual PID
-            running = b.is_running()
-            status = "running" if running else "stopped"
-            cpu = 0.0
-            mem = 0.0
-            pid = None
-            if running and b.pid:
-                try:
-                    p = psutil.Process(b.pid)
-                    pid = p.pid
-                    # Use non-blocking cpu_percent (cached) — avoid interval sleeps
-                    _ = p.cpu_percent(interval=None)
-                    cpu = p.cpu_percent(interval=None)
-                    mem = p.memory_info().rss / (1024 * 1024)
-                except Exception:
-                    pass
+    def select(self, labels: Dict[str, str]) -> List[str]:
+        """IDs of bots whose config [labels] table matches every pair given."""
+        out = []
+        for bot_id in list(self.bots):
+            have = self.configs.labels(self.config_path(bot_id))
+            if all(str(have.get(k)) == str(v) for k, v in labels.items()):
+                out.append(bot_id)
+        return out
+
+    def display_name(self, bot_id: str) -> str:
+        b = self.bots.get(bot_id)
+        if b is None:
+            return bot_id
+        return self.configs.display_name(b.path / "config.toml", bot_id)
 
-            name = bot_id
-            try:
-                with open(self.config_path(bot_id), "rb") as f:
-                    name = tomli.load(f).get("persona", {}).get("name", bot_id)
-            except Exception:
-                pass
-
-            items.append({
-                "id": bot_id,
-                "name": name,
-                "status": status,
-                "pid": pid,
-                "cpu": round(cpu, 1),
-                "memory_mb": round(mem, 1),
-                "started_at": b.started_at.isoformat() if b.started_at else None,
-                "log": str(b.logfile)
-            })
-        return items
+    def snapshot(self) -> List[dict]:
+        # Served from the supervisor's cache; no per-call psutil work
+        if self.cluster is not None:
+            return self.cluster.snapshot()
+        return self.supervisor.snapshot()
+
+    # ---------- cluster ----------
+    def owns(self, bot_id: str) -> bool:
+        """True if this process supervises and schedules the bot."""
+        return self.cluster is None or self.cluster.owns(bot_id)
+
+    def run_state(self, bot_id: str):
+        """(running, pid); for another worker's bot, from its status row."""
+        if self.owns(bot_id):
+            b = self._get(bot_id)
+            return b.is_running(), b.pid
+        row = self.cluster.row(bot_id)
+        if row is None:
+            return False, None
+        return row["status"] != "stopped", row["pid"]
+
+    def sync(self):
+        """Pick up bots other workers created, deleted or relinked."""
+        events = self.journal.since(self._seq)
+        if events is None:
+            # fell behind a compaction: diff against the full state instead
+            self._seq = self.journal.last_seq()
+            state = self.journal.replay()
+            events = [(0, b, "created", st) for b, st in state.items() if b not in self.bots]
+            events += [(0, b, "deleted", {}) for b in list(self.bots) if b not in state]
+        for seq, bot_id, kind, data in events:
+            self._seq = max(self._seq, seq)
+            if kind == "created" and bot_id not in self.bots and data.get("path"):
+                bp = BotProc(bot_id, Path(data["path"]))
+                bp.version = data.get("version")
+                self._update_bots({bot_id: bp})
+                if self.owns(bot_id):
+                    self._apply_schedules(bot_id)
+                self.supervisor.refresh(bot_id)
+            elif kind == "deleted" and bot_id in self.bots and not self.owns(bot_id):
+                self._update_bots(remove=[bot_id])
+                self.history.forget(bot_id)
+                self.supervisor.refresh(bot_id)
+            elif kind == "upgraded" and bot_id in self.bots:
+                self.bots[bot_id].version = data.get("version")
+
+    def rebalance(self, gained: set, lost: set):
+        """Take on the bots of newly leased shards and let go of lost ones."""
+        for bot_id in [b for b in list(self.bots) if shard_of(b) in lost]:
+            self._reconcile_schedules(bot_id, [])
+            self.pump.detach(bot_id)
+            self.restarts.forget(bot_id)
+            self.supervisor.refresh(bot_id)
+        mine = [b for b in list(self.bots) if shard_of(b) in gained]
+        if not mine:
+            return
+        state = self.journal.replay()
+        for bot_id in mine:
+            with self.lock(bot_id):
+                b = self.bots.get(bot_id)
+                if b is None:
+                    continue
+                st = state.get(bot_id, {})
+                if b.proc is None and st.get("pid"):
+                    # left running by a worker that went away; only its host can see it
+                    if st.get("host") in (None, HOST) and same_process(st["pid"], st.get("create_time"), str(b.path)):
+                        b.pid = st["pid"]
+                        b.exited.clear()
+                        if st.get("started_at"):
+                            b.started_at = datetime.fromisoformat(st["started_at"])
+                        self._follow_log(b)
+                    elif st.get("host") in (None, HOST):
+                        self.journal.record(bot_id, "exited", code=None)
+                    else:
+                        print(f"Bot {bot_id} was started on {st['host']}; not adopting pid {st['pid']}")
+                b.last_exit = st.get("last_exit", b.last_exit)
+                self._apply_schedules(bot_id)
+                self.supervisor.refresh(bot_id)
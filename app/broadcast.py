@@ -0,0 +1,195 @@
+# app/broadcast.py
+import json
+import asyncio
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from .utils import wait_disconnect
+from . import wire
+
+
+class _Subscriber:
+    def __init__(self, ws: WebSocket, max_pending: int, fmt: str = "json"):
+        self.ws = ws
+        self.fmt = fmt
+        self.frames = deque()
+        self.max_pending = max_pending
+        # A fresh subscriber (or one that fell behind) gets a full snapshot
+        self.resync = True
+        self.closed = False
+        self.ready = asyncio.Event()
+        self.ready.set()
+
+    def push(self, frame):
+        if self.resync:
+            # The pending full snapshot already covers this tick
+            self.ready.set()
+            return
+        if len(self.frames) >= self.max_pending:
+            # Too far behind: throw the backlog away, catch up with one snapshot
+            self.frames.clear()
+            self.resync = True
+        else:
+            self.frames.append(frame)
+        self.ready.set()
+
+
+class StatusBroadcaster:
+    """One producer for /ws/status, shared by every connected dashboard.
+
+    Each tick the snapshot is read and diffed against the previous one once;
+    the serialized frame is then handed to every subscriber as the same str
+    (or, for compact subscribers, the same bytes per format).
+    Subscribers send from their own task, so a slow client only delays
+    itself: its backlog is coalesced into a single snapshot and it is
+    dropped if a send stalls for longer than send_timeout.
+    """
+
+    def __init__(self, snapshot: Callable[[], List[dict]], interval: float = 2.0,
+                 max_pending: int = 4, send_timeout: float = 10.0):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.subscribers: Dict[WebSocket, _Subscriber] = {}
+        self._rows: Dict[str, dict] = {}
+        self._snap = None
+        self._full: Optional[str] = None
+        # compact formats: one shared interning/delta state, kept current
+        # only while compact subscribers are connected
+        self._compact = wire.CompactStatus()
+        self._compact_stale = True
+        self._compact_full: Dict[str, bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ---------- producer ----------
+    async def _run(self):
+        while True:
+            if not self.subscribers:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Status broadcast error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def tick(self):
+        snap = self.snapshot()
+        if snap is self._snap:
+            # nothing was published since the last tick
+            return
+        self._snap = snap
+        rows = {r["id"]: r for r in snap}
+        # published rows are immutable, so an unchanged row is the same object
+        changed = [r for bot_id, r in rows.items()
+                   if self._rows.get(bot_id) is not r and self._rows.get(bot_id) != r]
+        removed = [bot_id for bot_id in self._rows if bot_id not in rows]
+        self._rows = rows
+        self._full = None
+        frames = {}
+        fmts = {sub.fmt for sub in self.subscribers.values()}
+        if "json" in fmts and (changed or removed):
+            frames["json"] = json.dumps({"type": "diff", "changed": changed, "removed": removed})
+        compact = fmts - {"json"}
+        if compact and not self._compact_stale:
+            diff = self._compact.update(rows)
+            if diff is not None:
+                self._compact_full = {}
+                for fmt in compact:
+                    frames[fmt] = wire.encode(diff, fmt)
+        else:
+            self._compact_stale = True
+        for sub in self.subscribers.values():
+            frame = frames.get(sub.fmt)
+            if frame is not None:
+                sub.push(frame)
+
+    def publish_event(self, event: dict):
+        """Push a lifecycle event (starting/running/stopping/exited) now,
+        without waiting for the next tick."""
+        frame = json.dumps(event)
+        for sub in self.subscribers.values():
+            sub.push(frame)
+
+    def full_frame(self, fmt: str = "json"):
+        # Serialized at most once per tick, only if someone needs it
+        if fmt != "json":
+            return self._compact_full_frame(fmt)
+        if self._full is None:
+            self._full = json.dumps({"type": "snapshot", "bots": list(self._rows.values())})
+        return self._full
+
+    def _compact_full_frame(self, fmt: str) -> bytes:
+        if self._compact_stale:
+            # nobody needed deltas for a while: catch up without sending them
+            self._compact.update(self._rows)
+            self._compact_stale = False
+            self._compact_full = {}
+        frame = self._compact_full.get(fmt)
+        if frame is None:
+            frame = self._compact_full[fmt] = wire.encode(self._compact.full(), fmt)
+        return frame
+
+    # ---------- subscribers ----------
+    async def serve(self, ws: WebSocket, fmt: str = "json"):
+        """Stream status frames to one websocket until it goes away.
+
+        Compact formats (see wire.py) start with a JSON "hello" frame, then
+        a full binary frame and binary diffs with interned IDs and deltas.
+        """
+        sub = _Subscriber(ws, self.max_pending, fmt)
+        if fmt != "json":
+            await asyncio.wait_for(ws.send_text(wire.hello(fmt)), self.send_timeout)
+        if not self.subscribers:
+            # Producer was idle, so the cached rows may be stale
+            self.tick()
+        self.subscribers[ws] = sub
+        if self._wakeup is not None:
+            self._wakeup.set()
+        watcher = asyncio.create_task(self._watch(sub))
+        try:
+            while True:
+                await sub.ready.wait()
+                sub.ready.clear()
+                if sub.closed:
+                    break
+                if sub.resync:
+                    sub.resync = False
+                    sub.frames.clear()
+                    await asyncio.wait_for(_send(ws, self.full_frame(fmt)), self.send_timeout)
+                while sub.frames and not sub.resync:
+                    frame = sub.frames.popleft()
+                    await asyncio.wait_for(_send(ws, frame), self.send_timeout)
+        except asyncio.TimeoutError:
+            print("Dropping slow status client")
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        finally:
+            watcher.cancel()
+            self.subscribers.pop(ws, None)
+
+    async def _watch(self, sub: _Subscriber):
+        await wait_disconnect(sub.ws)
+        sub.closed = True
+        sub.ready.set()
+
+
+def _send(ws: WebSocket, frame):
+    # lifecycle events stay JSON text on every format
+    return ws.send_bytes(frame) if isinstance(frame, bytes) else ws.send_text(frame)
@@ -0,0 +1,160 @@
+# app/cgroups.py
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+CGROUP_ROOT = os.environ.get("CGROUP_ROOT", "/sys/fs/cgroup")
+# Parent group for all bots, relative to CGROUP_ROOT; must be delegated to
+# the manager (e.g. a systemd slice with Delegate=yes) or writable by it
+PARENT = "bot-manager"
+CPU_PERIOD = 100000
+CONTROLLERS = ("cpu", "memory", "pids")
+
+_UNITS = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_bytes(value) -> Optional[int]:
+    """512M / 1G / 1048576 -> bytes; None, "" or "max" -> no limit."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    v = str(value).strip().lower()
+    if v in ("", "max"):
+        return None
+    if v.endswith("b"):
+        v = v[:-1]
+    if v and v[-1] in _UNITS:
+        return int(float(v[:-1]) * _UNITS[v[-1]])
+    return int(float(v))
+
+
+class CgroupManager:
+    """Optional cgroup v2 placement and accounting for bot processes.
+
+    Each bot gets <root>/<parent>/<bot_id> with cpu.weight, cpu.max,
+    memory.max and pids.max from its limits. Usage comes from cpu.stat,
+    memory.current and pids.current, which also cover any processes the
+    bot forks. When cgroup v2 is missing or not writable every call is a
+    no-op and the supervisor keeps using psutil.
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT, parent: str = PARENT, enabled: bool = True):
+        self.root = root
+        self.parent = os.path.join(root, parent)
+        self.available = False
+        self._lock = threading.Lock()
+        # bot_id -> (monotonic time, usage_usec) of the previous sample
+        self._last_cpu: Dict[str, tuple] = {}
+        if enabled:
+            self.available = self._setup()
+
+    def _setup(self) -> bool:
+        if not os.path.exists(os.path.join(self.root, "cgroup.controllers")):
+            print("cgroup v2 not mounted; bot resource limits disabled")
+            return False
+        try:
+            os.makedirs(self.parent, exist_ok=True)
+            # controllers have to be enabled on every level down to the bots
+            want = " ".join("+" + c for c in CONTROLLERS)
+            for d in (os.path.dirname(self.parent), self.parent):
+                _write(os.path.join(d, "cgroup.subtree_control"), want)
+        except OSError as e:
+            print(f"cgroup setup failed under {self.parent}: {e}; bot resource limits disabled")
+            return False
+        return True
+
+    def path(self, bot_id: str) -> str:
+        return os.path.join(self.parent, bot_id)
+
+    def place(self, bot_id: str, pid: int, limits: dict) -> bool:
+        """Apply limits to the bot's group and move pid into it."""
+        if not self.available:
+            return False
+        d = self.path(bot_id)
+        try:
+            os.makedirs(d, exist_ok=True)
+            self.apply(bot_id, limits)
+            _write(os.path.join(d, "cgroup.procs"), str(pid))
+        except OSError as e:
+            print(f"Could not place {bot_id} (pid {pid}) in {d}: {e}")
+            return False
+        with self._lock:
+            self._last_cpu.pop(bot_id, None)
+        return True
+
+    def apply(self, bot_id: str, limits: dict):
+        """Write limits to an existing group; unset keys mean unlimited."""
+        d = self.path(bot_id)
+        weight = limits.get("cpu_weight")
+        _write(os.path.join(d, "cpu.weight"), str(int(weight)) if weight else "100")
+        cpus = limits.get("cpu_max")
+        quota = f"{int(float(cpus) * CPU_PERIOD)} {CPU_PERIOD}" if cpus else f"max {CPU_PERIOD}"
+        _write(os.path.join(d, "cpu.max"), quota)
+        mem = parse_bytes(limits.get("memory_max"))
+        _write(os.path.join(d, "memory.max"), str(mem) if mem else "max")
+        pids = limits.get("pids_max")
+        _write(os.path.join(d, "pids.max"), str(int(pids)) if pids else "max")
+
+    def stats(self, bot_id: str) -> Optional[dict]:
+        """Usage of the bot's group, or None if it has no group."""
+        if not self.available:
+            return None
+        d = self.path(bot_id)
+        try:
+            cpu = _keyed(os.path.join(d, "cpu.stat"))
+            mem = int(_read(os.path.join(d, "memory.current")))
+            pids = int(_read(os.path.join(d, "pids.current")))
+            events = _keyed(os.path.join(d, "memory.events"))
+        except (OSError, ValueError):
+            return None
+        usage = cpu.get("usage_usec", 0)
+        now = time.monotonic()
+        with self._lock:
+            prev = self._last_cpu.get(bot_id)
+            self._last_cpu[bot_id] = (now, usage)
+        percent = 0.0
+        if prev is not None and now > prev[0]:
+            percent = (usage - prev[1]) / ((now - prev[0]) * 1e6) * 100
+        return {
+            "cpu_percent": round(max(percent, 0.0), 1),
+            "cpu_usec": usage,
+            "throttled_usec": cpu.get("throttled_usec", 0),
+            "memory_bytes": mem,
+            "pids": pids,
+            "oom_kills": events.get("oom_kill", 0),
+        }
+
+    def release(self, bot_id: str):
+        """Remove the bot's group once its processes are gone."""
+        if not self.available:
+            return
+        with self._lock:
+            self._last_cpu.pop(bot_id, None)
+        try:
+            os.rmdir(self.path(bot_id))
+        except OSError:
+            # still has members (a stray grandchild) or never existed
+            pass
+
+
+def _read(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read().strip()
+
+
+def _write(path: str, value: str):
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def _keyed(path: str) -> Dict[str, int]:
+    out = {}
+    for line in _read(path).splitlines():
+        k, _, v = line.partition(" ")
+        try:
+            out[k] = int(v)
+        except ValueError:
+            pass
+    return out
@@ -0,0 +1,350 @@
+# app/cluster.py
+import os
+import json
+import time
+import zlib
+import socket
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+# Bots are spread over this many shards; workers lease whole shards
+SHARDS = 64
+# A lease not renewed for this long is up for grabs
+LEASE_SECONDS = 15.0
+# How often leases are renewed and rebalanced
+HEARTBEAT_SECONDS = 5.0
+# How often a worker looks for commands addressed to its shards
+COMMAND_POLL = 0.2
+# Commands nobody picked up within this many seconds are dropped
+COMMAND_EXPIRE = 60.0
+# Finished commands are kept this long for the caller to read
+COMMAND_TTL = 3600.0
+
+COMMANDS = ("start", "stop", "restart", "delete", "reload")
+
+
+def shard_of(bot_id: str) -> int:
+    return zlib.crc32(bot_id.encode()) % SHARDS
+
+
+class SQLiteClusterStore:
+    """Shared state of a manager cluster in one SQLite file (WAL mode).
+
+    workers: heartbeats; leases: shard -> owning worker until `expires`;
+    commands: lifecycle calls forwarded to a bot's owner; status: the
+    status row each owner last published for its bots. Every method is
+    one short transaction, so any number of worker processes on the host
+    can share the file. Another backend has to provide the same methods.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                seen REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                shard INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS commands (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bot TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                state TEXT NOT NULL,
+                result TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS commands_pending ON commands (state, shard);
+            CREATE TABLE IF NOT EXISTS status (
+                bot TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+        """)
+
+    def _tx(self, fn):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self.db)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return out
+
+    # ---------- membership and leases ----------
+    def heartbeat(self, worker: str) -> int:
+        """Record that `worker` is alive; returns the number of live workers."""
+        now = time.time()
+
+        def tx(db):
+            db.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)",
+                       (worker, socket.gethostname(), os.getpid(), now))
+            db.execute("DELETE FROM workers WHERE seen < ?", (now - 4 * LEASE_SECONDS,))
+            return db.execute("SELECT COUNT(*) FROM workers WHERE seen >= ?",
+                              (now - LEASE_SECONDS,)).fetchone()[0]
+        return self._tx(tx)
+
+    def claim(self, worker: str, want: int, keep: Set[int]) -> Set[int]:
+        """Renew our leases and move toward holding `want` shards.
+
+        Shards over the share are given back, except those in `keep`;
+        free or expired shards are taken up to the share.
+        """
+        now = time.time()
+
+        def tx(db):
+            rows = db.execute("SELECT shard, owner, expires FROM leases").fetchall()
+            mine = {s for s, owner, _ in rows if owner == worker}
+            taken = {s for s, owner, expires in rows if owner != worker and expires > now}
+            extra = len(mine) - want
+            if extra > 0:
+                for s in sorted(mine - keep, reverse=True)[:extra]:
+                    db.execute("DELETE FROM leases WHERE shard = ? AND owner = ?", (s, worker))
+                    mine.discard(s)
+            free = [s for s in range(SHARDS) if s not in mine and s not in taken]
+            mine.update(free[:max(0, want - len(mine))])
+            db.executemany("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)",
+                           [(s, worker, now + LEASE_SECONDS) for s in mine])
+            return mine
+        return self._tx(tx)
+
+    def release(self, worker: str):
+        def tx(db):
+            db.execute("DELETE FROM leases WHERE owner = ?", (worker,))
+            db.execute("DELETE FROM workers WHERE id = ?", (worker,))
+        self._tx(tx)
+
+    def workers(self) -> List[dict]:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT w.id, w.host, w.pid, w.seen, COUNT(l.shard) FROM workers w "
+                "LEFT JOIN leases l ON l.owner = w.id AND l.expires > ? "
+                "GROUP BY w.id ORDER BY w.id", (time.time(),)).fetchall()
+        return [{"id": i, "host": h, "pid": p, "seen": s, "shards": n} for i, h, p, s, n in rows]
+
+    # ---------- forwarded commands ----------
+    def send(self, bot_id: str, action: str) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self.db.execute(
+                "INSERT INTO commands (bot, shard, action, state, created, updated) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)", (bot_id, shard_of(bot_id), action, now, now))
+            return cur.lastrowid
+
+    def take(self, worker: str) -> List[Tuple[int, str, str]]:
+        """Claim pending commands for shards `worker` holds."""
+        now = time.time()
+
+        def tx(db):
+            rows = db.execute(
+                "SELECT id, bot, action FROM commands WHERE state = 'pending' AND created >= ? "
+                "AND shard IN (SELECT shard FROM leases WHERE owner = ? AND expires > ?)",
+                (now - COMMAND_EXPIRE, worker, now)).fetchall()
+            if rows:
+                db.executemany("UPDATE commands SET state = 'running', updated = ? WHERE id = ?",
+                               [(now, r[0]) for r in rows])
+            return rows
+        return self._tx(tx)
+
+    def finish(self, cmd_id: int, state: str, result: dict):
+        now = time.time()
+
+        def tx(db):
+            db.execute("UPDATE commands SET state = ?, result = ?, updated = ? WHERE id = ?",
+                       (state, json.dumps(result), now, cmd_id))
+            db.execute("DELETE FROM commands WHERE updated < ?", (now - COMMAND_TTL,))
+        self._tx(tx)
+
+    def command(self, cmd_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self.db.execute("SELECT state, result, created FROM commands WHERE id = ?",
+                                  (cmd_id,)).fetchone()
+        if row is None:
+            return None
+        state, result, created = row
+        if state == "pending" and created < time.time() - COMMAND_EXPIRE:
+            state, result = "failed", json.dumps({"error": "no worker owns this bot"})
+        return {"state": state, "result": json.loads(result) if result else {}}
+
+    # ---------- status rows ----------
+    def publish(self, worker: str, rows: List[dict]):
+        if not rows:
+            return
+        now = time.time()
+        self._tx(lambda db: db.executemany(
+            "INSERT OR REPLACE INTO status VALUES (?, ?, ?, ?)",
+            [(r["id"], worker, json.dumps(r), now) for r in rows]))
+
+    def forget(self, bot_id: str):
+        with self._lock:
+            self.db.execute("DELETE FROM status WHERE bot = ?", (bot_id,))
+
+    def rows(self) -> Dict[str, dict]:
+        with self._lock:
+            return {bot: json.loads(data) for bot, data in self.db.execute("SELECT bot, data FROM status")}
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+class ClusterNode:
+    """This worker's part in a manager cluster.
+
+    Every bot belongs to one of SHARDS shards, and a worker supervises,
+    schedules and restarts only the bots of shards it holds a lease on.
+    Leases are renewed every HEARTBEAT_SECONDS and split evenly between
+    live workers, except that a shard with a bot this worker is running
+    stays put: only the parent can reap it. A worker that dies stops
+    renewing, and its shards (and, on the same host, its running bots'
+    PIDs) are taken over once the leases expire. Lifecycle calls for
+    another worker's bots are queued as commands for the owner.
+    """
+
+    def __init__(self, registry, lifecycle, store: SQLiteClusterStore,
+                 worker_id: Optional[str] = None):
+        self.reg = registry
+        self.lifecycle = lifecycle
+        self.store = store
+        self.id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.shards: Set[int] = set()
+        # status rows published by every worker, refreshed each interval
+        self._remote: Dict[str, dict] = {}
+        self._published: Dict[str, dict] = {}
+        self._tasks: List[asyncio.Task] = []
+        registry.cluster = self
+
+    def owns(self, bot_id: str) -> bool:
+        return shard_of(bot_id) in self.shards
+
+    def start(self):
+        """Keep leases, status and commands going; call from the running
+        loop after a first beat() so the worker holds shards before serving."""
+        self._tasks = [asyncio.create_task(self._every(HEARTBEAT_SECONDS, self.beat)),
+                       asyncio.create_task(self._every(self.reg.supervisor.interval, self.publish)),
+                       asyncio.create_task(self._commands())]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        # hand our shards over now instead of after LEASE_SECONDS
+        await asyncio.to_thread(self.store.release, self.id)
+
+    async def _every(self, interval: float, fn):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(fn)
+            except Exception as e:
+                print(f"Cluster {fn.__name__} failed: {e}")
+
+    def beat(self):
+        live = self.store.heartbeat(self.id)
+        want = -(-SHARDS // max(1, live))
+        keep = {shard_of(bot_id) for bot_id, b in list(self.reg.bots.items())
+                if self.owns(bot_id) and b.is_running()}
+        shards = self.store.claim(self.id, want, keep)
+        gained, lost = shards - self.shards, self.shards - shards
+        self.shards = shards
+        if gained or lost:
+            print(f"Cluster worker {self.id}: +{len(gained)} -{len(lost)} shards, holding {len(shards)}")
+            self.reg.rebalance(gained, lost)
+
+    def publish(self):
+        """Pick up other workers' changes and share our bots' status rows."""
+        self.reg.sync()
+        rows = [r for r in self.reg.supervisor.snapshot() if self.owns(r["id"])]
+        changed = [r for r in rows if self._published.get(r["id"]) != r]
+        self.store.publish(self.id, changed)
+        self._published = {r["id"]: r for r in rows}
+        self._remote = self.store.rows()
+
+    def snapshot(self) -> List[dict]:
+        local = {r["id"]: r for r in self.reg.supervisor.snapshot()}
+        out = []
+        for bot_id in list(self.reg.bots):
+            row = local.get(bot_id)
+            if not self.owns(bot_id) and bot_id in self._remote:
+                row = dict(self._remote[bot_id])
+            if row is not None:
+                out.append(row)
+        return out
+
+    def row(self, bot_id: str) -> Optional[dict]:
+        """Last status row the bot's owner published."""
+        return self._remote.get(bot_id)
+
+    # ---------- forwarded commands ----------
+    def send(self, bot_id: str, action: str) -> int:
+        return self.store.send(bot_id, action)
+
+    async def call(self, bot_id: str, action: str, timeout: float) -> dict:
+        """Run `action` on the bot's owner; returns {"state", "result"}."""
+        cmd_id = await asyncio.to_thread(self.store.send, bot_id, action)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            c = await asyncio.to_thread(self.store.command, cmd_id)
+            if c is not None and c["state"] in ("done", "failed"):
+                return c
+            await asyncio.sleep(COMMAND_POLL)
+        return {"state": "failed", "result": {"error": "timed out waiting for the owning worker"}}
+
+    def call_sync(self, bot_id: str, action: str, timeout: float) -> dict:
+        """call() for request threads."""
+        cmd_id = self.store.send(bot_id, action)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            c = self.store.command(cmd_id)
+            if c is not None and c["state"] in ("done", "failed"):
+                return c
+            time.sleep(COMMAND_POLL)
+        return {"state": "failed", "result": {"error": "timed out waiting for the owning worker"}}
+
+    async def _commands(self):
+        while True:
+            try:
+                for cmd_id, bot_id, action in await asyncio.to_thread(self.store.take, self.id):
+                    asyncio.create_task(self._execute(cmd_id, bot_id, action))
+            except Exception as e:
+                print(f"Cluster command poll failed: {e}")
+            await asyncio.sleep(COMMAND_POLL)
+
+    async def _execute(self, cmd_id: int, bot_id: str, action: str):
+        state, result = "done", {}
+        try:
+            if bot_id not in self.reg.bots:
+                # created by another worker since our last sync
+                await asyncio.to_thread(self.reg.sync)
+            if action in ("start", "stop", "restart"):
+                job = self.lifecycle.submit(bot_id, action)
+                await job.done.wait()
+                state = job.state
+                result = {"error": job.error, "exit_code": job.exit_code, "pid": job.pid}
+            elif action == "delete":
+                await asyncio.to_thread(self.reg.delete, bot_id)
+            elif action == "reload":
+                await asyncio.to_thread(self.reg._apply_schedules, bot_id)
+            else:
+                raise ValueError(f"Unknown command: {action}")
+        except Exception as e:
+            state, result = "failed", {"error": str(e) or type(e).__name__}
+        try:
+            await asyncio.to_thread(self.store.finish, cmd_id, state, result)
+        except Exception as e:
+            print(f"Could not report command {cmd_id} for {bot_id}: {e}")
@@ -0,0 +1,138 @@
+# app/configwrite.py
+import threading
+from typing import Any, Dict, List, Optional
+
+import tomli_w
+
+from .utils import atomic_write
+
+# Schema inference and coercion for the dynamic config editor
+
+def infer_schema_from_toml(data: Any) -> dict:
+    if isinstance(data, dict):
+        return {"type":"object","properties":{k:infer_schema_from_toml(v) for k,v in data.items()}}
+    if isinstance(data, bool): return {"type":"boolean"}
+    if isinstance(data, int): return {"type":"integer"}
+    if isinstance(data, float): return {"type":"number"}
+    if isinstance(data, list):
+        if all(isinstance(x, str) for x in data):
+            return {"type":"array","items":{"type":"string"}}
+        return {"type":"array","items":{"type":"any"}}
+    return {"type":"string"}
+
+def coerce(schema: dict, payload: Any) -> Any:
+    t = schema.get("type")
+    if t == "object":
+        out = {}
+        for k, sub in schema.get("properties", {}).items():
+            if k in payload:
+                out[k] = coerce(sub, payload[k])
+        # Include any extra keys (be flexible)
+        for k, v in payload.items():
+            if k not in out:
+                out[k] = v
+        return out
+    if t == "boolean":
+        v = payload
+        if isinstance(v, str): return v.lower() in ("true","1","yes","on")
+        return bool(v)
+    if t == "integer": return int(payload)
+    if t == "number": return float(payload)
+    if t == "array":
+        v = payload
+        if isinstance(v, str):
+            return [x.strip() for x in v.splitlines() if x.strip()]
+        if isinstance(v, list): return v
+        return [v]
+    return "" if payload is None else str(payload)
+
+
+# Bots made from the same template share one schema object
+_SCHEMAS: Dict[Any, dict] = {}
+_SCHEMAS_MAX = 256
+
+
+def _shape(data: Any) -> Any:
+    """Hashable signature of everything infer_schema_from_toml looks at."""
+    if isinstance(data, dict):
+        return ("o", tuple((k, _shape(v)) for k, v in data.items()))
+    if isinstance(data, list):
+        return ("a", all(isinstance(x, str) for x in data))
+    return type(data).__name__
+
+
+def schema_for(data: Any) -> dict:
+    key = _shape(data)
+    schema = _SCHEMAS.get(key)
+    if schema is None:
+        if len(_SCHEMAS) >= _SCHEMAS_MAX:
+            _SCHEMAS.clear()
+        schema = _SCHEMAS[key] = infer_schema_from_toml(data)
+    return schema
+
+
+class _Edit:
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.done = False
+        self.error: Optional[Exception] = None
+
+
+class ConfigWriter:
+    """Serialized, coalescing writes of bot config.toml files.
+
+    Edits for one bot queue up while a write for that bot is in flight;
+    whoever gets the bot's writer lock (reg.lock) next applies the whole
+    queue, writes the file once (temp file + os.replace) and re-applies
+    the schedules once if the [[schedules]] changed. Each PUT replaces the
+    whole config, so the last edit in a batch wins; earlier ones are
+    still validated. This is the only way a bot's config gets written.
+    """
+
+    def __init__(self, reg):
+        self.reg = reg
+        self._mu = threading.Lock()
+        self._queues: Dict[str, List[_Edit]] = {}
+        self.writes = 0
+        self.coalesced = 0
+
+    def write(self, bot_id: str, payload: dict):
+        edit = _Edit(payload)
+        with self._mu:
+            self._queues.setdefault(bot_id, []).append(edit)
+        # the same lock delete() and start/stop hold, so a write never
+        # lands in a directory that is being removed
+        with self.reg.lock(bot_id):
+            if not edit.done:
+                with self._mu:
+                    batch = self._queues.pop(bot_id, [])
+                self._commit(bot_id, batch)
+        if edit.error is not None:
+            raise edit.error
+
+    def _commit(self, bot_id: str, batch: List[_Edit]):
+        try:
+            # raises FileNotFoundError once the bot is gone
+            path = self.reg.config_path(bot_id)
+            store = self.reg.configs
+            current = store.load(path)
+            schema = store.schema(path) if current else None
+            final = None
+            for e in batch:
+                try:
+                    final = coerce(schema or schema_for(e.payload), e.payload)
+                except Exception as err:
+                    e.error = err
+            if final is not None:
+                atomic_write(path, tomli_w.dumps(final).encode("utf-8"))
+                store.invalidate(path)
+                self.writes += 1
+                self.coalesced += len(batch) - 1
+                if final.get("schedules") != current.get("schedules"):
+                    self.reg._apply_schedules(bot_id)
+        except Exception as err:
+            for e in batch:
+                e.error = e.error or err
+        finally:
+            for e in batch:
+                e.done = True
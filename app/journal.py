@@ -0,0 +1,226 @@
+# app/journal.py
+import os
+import json
+import time
+import sqlite3
+import psutil
+import threading
+from typing import Dict, List, Optional
+
+# Fold the event log into the state table once it grows past this
+COMPACT_EVERY = 10000
+
+
+class StateJournal:
+    """Append-only record of bot lifecycle events in SQLite (WAL mode).
+
+    Events: created(path, version), deleted, started(pid, create_time,
+    started_at, host), exited(code) and upgraded(version). `state` holds
+    the fold of every event up to the `checkpoint` sequence number;
+    replay() applies the newer events on top of it, compact() moves them
+    into it. Boot reads one small table instead of walking the bots
+    directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                bot TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                bot TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._pending = self.db.execute(
+            "SELECT COUNT(*) FROM events WHERE seq > ?", (self._checkpoint(),)).fetchone()[0]
+
+    def _checkpoint(self) -> int:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'checkpoint'").fetchone()
+        return int(row[0]) if row else 0
+
+    @property
+    def initialized(self) -> bool:
+        """False until the first boot has imported the existing bots."""
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM meta WHERE key = 'initialized'").fetchone() is not None
+
+    def mark_initialized(self):
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('initialized', '1')")
+
+    def record(self, bot_id: str, kind: str, **data):
+        with self._lock:
+            self.db.execute("INSERT INTO events (ts, bot, kind, data) VALUES (?, ?, ?, ?)",
+                            (time.time(), bot_id, kind, json.dumps(data)))
+            self._pending += 1
+            due = self._pending >= COMPACT_EVERY
+        if due:
+            self.compact()
+
+    def record_many(self, events):
+        """Append (bot_id, kind, data) events in one transaction."""
+        now = time.time()
+        with self._lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("INSERT INTO events (ts, bot, kind, data) VALUES (?, ?, ?, ?)",
+                                    [(now, b, k, json.dumps(d)) for b, k, d in events])
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            self._pending += len(events)
+            due = self._pending >= COMPACT_EVERY
+        if due:
+            self.compact()
+
+    def allocate(self, key: str, n: int, floor: int = 1) -> int:
+        """Reserve n numbers from the persistent counter `key`.
+
+        Returns the first one; the counter never goes below `floor`.
+        """
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+                first = max(int(row[0]) if row else 1, floor)
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(first + n)))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return first
+
+    def replay(self) -> Dict[str, dict]:
+        """Current state of every bot: {bot_id: {path, pid, create_time, ...}}."""
+        with self._lock:
+            bots = {bot: json.loads(data) for bot, data in self.db.execute("SELECT bot, data FROM state")}
+            rows = self.db.execute(
+                "SELECT seq, bot, kind, data FROM events WHERE seq > ? ORDER BY seq",
+                (self._checkpoint(),)).fetchall()
+        for _seq, bot, kind, data in rows:
+            _apply(bots, bot, kind, json.loads(data))
+        return bots
+
+    def last_seq(self) -> int:
+        with self._lock:
+            row = self.db.execute("SELECT MAX(seq) FROM events").fetchone()
+            return max(row[0] or 0, self._checkpoint())
+
+    def since(self, seq: int) -> Optional[List[tuple]]:
+        """(seq, bot, kind, data) of events after `seq`, written by any process.
+
+        None if some of them were already compacted away; the caller then
+        has to fall back to replay().
+        """
+        with self._lock:
+            self.db.execute("BEGIN")
+            try:
+                if seq < self._checkpoint():
+                    return None
+                rows = self.db.execute(
+                    "SELECT seq, bot, kind, data FROM events WHERE seq > ? ORDER BY seq",
+                    (seq,)).fetchall()
+            finally:
+                self.db.execute("COMMIT")
+        return [(s, bot, kind, json.loads(data)) for s, bot, kind, data in rows]
+
+    def compact(self):
+        with self._lock:
+            checkpoint = self._checkpoint()
+            rows = self.db.execute(
+                "SELECT seq, bot, kind, data FROM events WHERE seq > ? ORDER BY seq",
+                (checkpoint,)).fetchall()
+            if not rows:
+                return
+            bots = {}
+            touched = {r[1] for r in rows}
+            for bot, data in self.db.execute("SELECT bot, data FROM state"):
+                if bot in touched:
+                    bots[bot] = json.loads(data)
+            for _seq, bot, kind, data in rows:
+                _apply(bots, bot, kind, json.loads(data))
+            last = rows[-1][0]
+            self.db.execute("BEGIN")
+            try:
+                for bot in touched:
+                    if bot in bots:
+                        self.db.execute("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                                        (bot, json.dumps(bots[bot])))
+                    else:
+                        self.db.execute("DELETE FROM state WHERE bot = ?", (bot,))
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('checkpoint', ?)", (str(last),))
+                self.db.execute("DELETE FROM events WHERE seq <= ?", (last,))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+def _apply(bots: Dict[str, dict], bot: str, kind: str, data: dict):
+    if kind == "deleted":
+        bots.pop(bot, None)
+        return
+    st = bots.setdefault(bot, {"path": None, "pid": None, "create_time": None,
+                               "started_at": None, "last_exit": None, "starts": 0,
+                               "version": None})
+    if kind == "created":
+        st["path"] = data["path"]
+        st["version"] = data.get("version")
+    elif kind == "upgraded":
+        st["version"] = data.get("version")
+    elif kind == "started":
+        st["pid"] = data["pid"]
+        st["create_time"] = data.get("create_time")
+        st["started_at"] = data.get("started_at")
+        st["host"] = data.get("host")
+        st["starts"] += 1
+    elif kind == "exited":
+        st["pid"] = None
+        st["create_time"] = None
+        st["last_exit"] = data.get("code")
+
+
+def same_process(pid: Optional[int], create_time: Optional[float], path: Optional[str] = None) -> bool:
+    """True if pid still belongs to the process that was started then.
+
+    Without a recorded start time a live PID proves nothing, since it may
+    have been recycled; it then has to be a bot.py running in `path`.
+    """
+    if not pid:
+        return False
+    try:
+        p = psutil.Process(pid)
+        if p.status() == psutil.STATUS_ZOMBIE:
+            return False
+        if create_time is None:
+            return path is not None and _runs_bot(p, path)
+        # A recycled PID after a reboot has a different start time
+        return abs(p.create_time() - create_time) < 1.0
+    except Exception:
+        return False
+
+
+def _runs_bot(p: psutil.Process, path: str) -> bool:
+    # zygote-forked bots show the zygote's command line, which ends in bot.py too
+    return (os.path.realpath(p.cwd()) == os.path.realpath(path)
+            and any(os.path.basename(a) == "bot.py" for a in p.cmdline()))
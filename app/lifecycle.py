@@ -0,0 +1,356 @@
+# app/lifecycle.py
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .bots_manager import BotRegistry, STOP_TIMEOUT
+
+ACTIONS = ("start", "stop", "restart")
+# Finished jobs kept around for GET /api/jobs/{id}
+MAX_JOBS = 1000
+# Defaults for fleet-wide batches
+BATCH_CONCURRENCY = 16
+BATCH_STAGGER = 0.0
+# Defaults for rolling template upgrades
+UPGRADE_BATCH_SIZE = 10
+UPGRADE_HEALTH_SECONDS = 10.0
+MAX_UPGRADES = 100
+# Extra seconds a job forwarded to another worker may take
+FORWARD_GRACE = 30.0
+
+
+class Job:
+    def __init__(self, bot_id: str, action: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.bot_id = bot_id
+        self.action = action
+        self.state = "queued"          # queued|running|done|failed
+        self.error: Optional[str] = None
+        self.exit_code: Optional[int] = None
+        self.pid: Optional[int] = None     # of the process a start launched
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "bot_id": self.bot_id,
+            "action": self.action,
+            "state": self.state,
+            "error": self.error,
+            "exit_code": self.exit_code,
+            "pid": self.pid,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class Upgrade:
+    """Progress of one rolling template upgrade."""
+
+    def __init__(self, version: str, bot_ids: List[str], batch_size: int,
+                 concurrency: int, health_seconds: float, rollback: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.version = version
+        self.bot_ids = bot_ids
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.health_seconds = health_seconds
+        self.rollback = rollback
+        self.state = "queued"          # queued|running|done|failed
+        self.error: Optional[str] = None
+        self.batches_done = 0
+        self.upgraded: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.rolled_back: List[str] = []
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "version": self.version,
+            "state": self.state,
+            "error": self.error,
+            "bots": len(self.bot_ids),
+            "batch_size": self.batch_size,
+            "batches": -(-len(self.bot_ids) // self.batch_size),
+            "batches_done": self.batches_done,
+            "upgraded": self.upgraded,
+            "failed": self.failed,
+            "rolled_back": self.rolled_back,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class LifecycleEngine:
+    """Runs start/stop/restart on the event loop and hands back a Job.
+
+    Nothing here blocks a request thread: stop sends SIGTERM and awaits
+    the exit event the supervisor raises when it reaps the child (the
+    supervisor also owns the SIGKILL timer). Operations on one bot are
+    serialized; different bots proceed in parallel.
+    """
+
+    def __init__(self, registry: BotRegistry, stop_timeout: float = STOP_TIMEOUT):
+        self.reg = registry
+        self.stop_timeout = stop_timeout
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.upgrades: "OrderedDict[str, Upgrade]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # jobs holding or waiting for each lock; the lock goes when none are left
+        self._lock_users: Dict[str, int] = {}
+        self._exit_waiters: Dict[str, List[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.on_event: List[Callable[[dict], None]] = []
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Hook into registry transitions; call once from the running loop."""
+        self._loop = loop
+        self.reg.add_listener(self._from_registry)
+
+    def _from_registry(self, bot_id: str, state: str, info: dict):
+        # registry listeners run on whatever thread made the transition
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._dispatch, bot_id, state, info)
+
+    def _dispatch(self, bot_id: str, state: str, info: dict):
+        if state == "exited":
+            for fut in self._exit_waiters.pop(bot_id, []):
+                if not fut.done():
+                    fut.set_result(info.get("code"))
+        event = {"type": "event", "bot": bot_id, "state": state}
+        event.update(info)
+        for fn in self.on_event:
+            fn(event)
+
+    # ---------- jobs ----------
+    def submit(self, bot_id: str, action: str) -> Job:
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        self.reg._get(bot_id)  # 404 early for unknown bots
+        job = Job(bot_id, action)
+        self.jobs[job.id] = job
+        while len(self.jobs) > MAX_JOBS:
+            self.jobs.popitem(last=False)
+        if self.reg.owns(bot_id):
+            asyncio.create_task(self._run(job))
+        else:
+            asyncio.create_task(self._forward(job))
+        return job
+
+    async def run_batch(self, bot_ids: List[str], action: str,
+                        concurrency: int = BATCH_CONCURRENCY,
+                        stagger: float = BATCH_STAGGER) -> AsyncIterator[Job]:
+        """Run `action` over many bots, yielding each job as it finishes.
+
+        At most `concurrency` jobs are in flight, and job launches are
+        spaced `stagger` seconds apart so a fleet restart does not start
+        every interpreter in the same instant.
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(max(1, concurrency))
+        results: asyncio.Queue = asyncio.Queue()
+        next_launch = loop.time()
+
+        async def one(bot_id: str):
+            nonlocal next_launch
+            async with sem:
+                if stagger > 0:
+                    now = loop.time()
+                    at = max(now, next_launch)
+                    next_launch = at + stagger
+                    if at > now:
+                        await asyncio.sleep(at - now)
+                try:
+                    job = self.submit(bot_id, action)
+                except Exception as e:
+                    job = Job(bot_id, action)
+                    job.state, job.error = "failed", str(e) or type(e).__name__
+                    job.finished_at = time.time()
+                    job.done.set()
+                await job.done.wait()
+            await results.put(job)
+
+        # The batch keeps going even if the caller stops listening
+        tasks = [asyncio.create_task(one(b)) for b in bot_ids]
+        for _ in tasks:
+            yield await results.get()
+
+    # ---------- rolling upgrades ----------
+    def start_upgrade(self, bot_ids: List[str], version: str,
+                      batch_size: int = UPGRADE_BATCH_SIZE, concurrency: Optional[int] = None,
+                      health_seconds: float = UPGRADE_HEALTH_SECONDS,
+                      rollback: bool = True) -> Upgrade:
+        """Move bots to a stored template version, one batch at a time.
+
+        Each batch is relinked, its running bots are restarted (at most
+        `concurrency` at once), and after `health_seconds` every restarted
+        bot must still be up on the same launch. An unhealthy batch stops
+        the upgrade and, with `rollback`, is put back on its old version.
+        """
+        if not self.reg.templates.exists(version):
+            raise FileNotFoundError(f"template version {version}")
+        for bot_id in bot_ids:
+            self.reg._get(bot_id)
+        u = Upgrade(version, list(bot_ids), batch_size,
+                    concurrency or batch_size, health_seconds, rollback)
+        self.upgrades[u.id] = u
+        while len(self.upgrades) > MAX_UPGRADES:
+            self.upgrades.popitem(last=False)
+        asyncio.create_task(self._upgrade(u))
+        return u
+
+    def get_upgrade(self, upgrade_id: str) -> Upgrade:
+        if upgrade_id not in self.upgrades:
+            raise FileNotFoundError(upgrade_id)
+        return self.upgrades[upgrade_id]
+
+    async def _upgrade(self, u: Upgrade):
+        u.state = "running"
+        try:
+            for i in range(0, len(u.bot_ids), u.batch_size):
+                batch = u.bot_ids[i:i + u.batch_size]
+                unhealthy, previous, running = await self._upgrade_batch(u, batch)
+                u.batches_done += 1
+                if unhealthy:
+                    u.error = f"batch {u.batches_done}: {len(unhealthy)} bot(s) unhealthy"
+                    if u.rollback:
+                        await self._roll_back(u, previous, running)
+                    u.state = "failed"
+                    return
+            u.state = "done"
+        except Exception as e:
+            u.state = "failed"
+            u.error = str(e) or type(e).__name__
+        finally:
+            u.finished_at = time.time()
+            u.done.set()
+
+    async def _upgrade_batch(self, u: Upgrade, batch: List[str]):
+        previous: Dict[str, Optional[str]] = {}
+        running: List[str] = []
+        for bot_id in batch:
+            try:
+                was_running, _pid = self.reg.run_state(bot_id)
+                previous[bot_id] = await asyncio.to_thread(self.reg.set_version, bot_id, u.version)
+            except Exception as e:
+                u.failed[bot_id] = str(e) or type(e).__name__
+                continue
+            if was_running:
+                running.append(bot_id)
+        # running bots only pick up the new code when they restart
+        restarted: Dict[str, Optional[int]] = {}
+        async for job in self.run_batch(running, "restart", u.concurrency):
+            if job.state == "done":
+                restarted[job.bot_id] = job.pid
+            else:
+                u.failed[job.bot_id] = job.error or "restart failed"
+        wait = u.health_seconds
+        if any(not self.reg.owns(b) for b in restarted):
+            # other workers' bots are seen through their published status rows
+            wait = max(wait, 2 * self.reg.supervisor.interval)
+        if restarted and wait > 0:
+            await asyncio.sleep(wait)
+        for bot_id, pid in restarted.items():
+            if bot_id not in self.reg.bots:
+                continue
+            # down, or restarted by the restart policy since: not healthy
+            up, now_pid = self.reg.run_state(bot_id)
+            if not up or now_pid != pid:
+                u.failed[bot_id] = "not running after health check"
+        for bot_id in previous:
+            if bot_id not in u.failed:
+                u.upgraded.append(bot_id)
+        unhealthy = [b for b in batch if b in u.failed]
+        return unhealthy, previous, running
+
+    async def _roll_back(self, u: Upgrade, previous: Dict[str, Optional[str]], running: List[str]):
+        restart = []
+        for bot_id, version in previous.items():
+            # bots that had a private copy of the code cannot go back to it
+            if not version or not self.reg.templates.exists(version):
+                continue
+            try:
+                await asyncio.to_thread(self.reg.set_version, bot_id, version)
+            except Exception as e:
+                print(f"Rollback of {bot_id} to {version} failed: {e}")
+                continue
+            if bot_id in u.upgraded:
+                u.upgraded.remove(bot_id)
+            u.rolled_back.append(bot_id)
+            if bot_id in running:
+                restart.append(bot_id)
+        async for _job in self.run_batch(restart, "restart", u.concurrency):
+            pass
+
+    def get(self, job_id: str) -> Job:
+        if job_id not in self.jobs:
+            raise FileNotFoundError(job_id)
+        return self.jobs[job_id]
+
+    async def _run(self, job: Job):
+        bot_id = job.bot_id
+        lock = self._locks.setdefault(bot_id, asyncio.Lock())
+        self._lock_users[bot_id] = self._lock_users.get(bot_id, 0) + 1
+        try:
+            async with lock:
+                job.state = "running"
+                try:
+                    if job.action in ("stop", "restart"):
+                        job.exit_code = await self._stop(bot_id)
+                    if job.action in ("start", "restart"):
+                        await self._start(bot_id)
+                        job.pid = self.reg._get(bot_id).pid
+                    job.state = "done"
+                except Exception as e:
+                    job.state = "failed"
+                    job.error = str(e) or type(e).__name__
+                finally:
+                    job.finished_at = time.time()
+                    job.done.set()
+        finally:
+            self._lock_users[bot_id] -= 1
+            if not self._lock_users[bot_id]:
+                del self._lock_users[bot_id]
+                self._locks.pop(bot_id, None)
+
+    async def _forward(self, job: Job):
+        # another worker owns the bot: it runs the job and reports back
+        job.state = "running"
+        try:
+            c = await self.reg.cluster.call(job.bot_id, job.action,
+                                            2 * self.stop_timeout + FORWARD_GRACE)
+            job.state = c["state"]
+            job.error = c["result"].get("error")
+            job.exit_code = c["result"].get("exit_code")
+            job.pid = c["result"].get("pid")
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e) or type(e).__name__
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    async def _start(self, bot_id: str):
+        # fork/exec is quick but still a syscall-heavy call; keep it off the loop
+        await asyncio.to_thread(self.reg.start, bot_id)
+
+    async def _stop(self, bot_id: str) -> Optional[int]:
+        fut = asyncio.get_running_loop().create_future()
+        self._exit_waiters.setdefault(bot_id, []).append(fut)
+        # takes the bot's writer lock, which a restart on another thread may hold
+        if not await asyncio.to_thread(self.reg.request_stop, bot_id, self.stop_timeout):
+            waiters = self._exit_waiters.get(bot_id, [])
+            if fut in waiters:
+                waiters.remove(fut)
+            return self.reg._get(bot_id).last_exit
+        # SIGKILL lands at stop_timeout; allow a little for the reap
+        return await asyncio.wait_for(fut, self.stop_timeout + 5)
@@ -0,0 +1,263 @@
+# app/logread.py
+import os
+import re
+import gzip
+import mmap
+from typing import List, Optional, Tuple
+
+from .logstore import load_index
+
+# Files at least this big are scanned through mmap instead of pread blocks
+MMAP_THRESHOLD = 8 * 1024 * 1024
+BLOCK = 64 * 1024
+# Upper bound for one offset/range read, whatever the client asks for
+MAX_READ = 4 * 1024 * 1024
+# Upper bound for one tail read, in lines
+MAX_TAIL_LINES = 10000
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _decode(data: bytes) -> List[str]:
+    if not data:
+        return []
+    text = data.decode("utf-8", errors="replace")
+    if text.endswith("\n"):
+        text = text[:-1]
+    return text.split("\n")
+
+
+def tail_offset(fh, size: int, n: int) -> int:
+    """Byte offset where the last n lines of the file start.
+
+    Scans backwards from EOF, so the cost depends on n and the line
+    length, not on the size of the file.
+    """
+    if n <= 0 or size == 0:
+        return size
+    fd = fh.fileno()
+    # A trailing newline terminates the last line, it does not start one
+    end = size
+    if os.pread(fd, 1, size - 1) == b"\n":
+        end -= 1
+
+    if size >= MMAP_THRESHOLD:
+        with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+            pos = end
+            for _ in range(n):
+                pos = mm.rfind(b"\n", 0, pos)
+                if pos < 0:
+                    return 0
+            return pos + 1
+
+    pos = end
+    remaining = n
+    while pos > 0:
+        start = max(0, pos - BLOCK)
+        block = os.pread(fd, pos - start, start)
+        count = block.count(b"\n")
+        if count >= remaining:
+            idx = len(block)
+            for _ in range(remaining):
+                idx = block.rfind(b"\n", 0, idx)
+            return start + idx + 1
+        remaining -= count
+        pos = start
+    return 0
+
+
+class _Piece:
+    """One segment of a (possibly rotated) log, in global offsets."""
+
+    def __init__(self, path: str, start: int, size: int, compressed: bool):
+        self.path = path
+        self.start = start
+        self.size = size
+        self.compressed = compressed
+
+    @property
+    def end(self) -> int:
+        return self.start + self.size
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Read `length` bytes at segment-local `offset`."""
+        if self.compressed:
+            return _gunzip(self.path)[offset:offset + length]
+        with open(self.path, "rb") as fh:
+            return _read(fh, offset, length)
+
+    def tail(self, n: int) -> int:
+        """Segment-local offset where its last n lines start."""
+        if self.compressed:
+            data = _gunzip(self.path)
+            pos = len(data) - 1 if data.endswith(b"\n") else len(data)
+            for _ in range(n):
+                pos = data.rfind(b"\n", 0, pos)
+                if pos < 0:
+                    return 0
+            return pos + 1
+        with open(self.path, "rb") as fh:
+            return tail_offset(fh, os.fstat(fh.fileno()).st_size, n)
+
+
+_gz_cache: Tuple[Optional[str], bytes] = (None, b"")
+
+
+def _gunzip(path: str) -> bytes:
+    # Paging through an archived segment hits the same file repeatedly
+    global _gz_cache
+    if _gz_cache[0] != path:
+        with gzip.open(path, "rb") as f:
+            _gz_cache = (path, f.read())
+    return _gz_cache[1]
+
+
+def pieces(path: str) -> List[_Piece]:
+    """Archived segments (oldest first) followed by the active file."""
+    out = []
+    d = os.path.dirname(path)
+    index = load_index(path)
+    for seg in index["segments"]:
+        fname = seg["file"] + (".gz" if seg["compressed"] else "")
+        seg_path = os.path.join(d, fname)
+        if not os.path.exists(seg_path):
+            # compression finished after we read the index
+            if os.path.exists(seg_path + ".gz"):
+                seg_path, seg["compressed"] = seg_path + ".gz", True
+            else:
+                continue
+        out.append(_Piece(seg_path, seg["start"], seg["size"], seg["compressed"]))
+    if index["segments"]:
+        last = index["segments"][-1]
+        base = last["start"] + last["size"]
+    else:
+        base = index.get("base", 0)
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    out.append(_Piece(path, base, size, False))
+    return out
+
+
+def iter_log(path: str, chunk: int = 1024 * 1024):
+    """The whole retained log as byte chunks, oldest segment first."""
+    for piece in pieces(path):
+        opener = gzip.open if piece.compressed else open
+        try:
+            with opener(piece.path, "rb") as f:
+                # the active file may grow meanwhile; stop at the size seen
+                left = piece.size
+                while left > 0:
+                    data = f.read(min(chunk, left))
+                    if not data:
+                        break
+                    left -= len(data)
+                    yield data
+        except OSError:
+            # pruned or compressed while we were streaming
+            continue
+
+
+def read_tail(path: str, n: int) -> Tuple[List[str], int, int]:
+    """Return (lines, start_offset, end_offset) for the last n lines.
+
+    Offsets are global across rotated segments; older segments are only
+    touched when the active one holds fewer than n lines. n is capped at
+    MAX_TAIL_LINES.
+    """
+    n = min(n, MAX_TAIL_LINES)
+    parts = pieces(path)
+    end = parts[-1].end
+    lines: List[str] = []
+    start = end
+    for piece in reversed(parts):
+        need = n - len(lines)
+        if need <= 0:
+            break
+        local = piece.tail(need) if piece.size else 0
+        lines = _decode(piece.read(local, piece.size - local)) + lines
+        start = piece.start + local
+        if local > 0:
+            break
+    return lines, start, end
+
+
+def read_from(path: str, offset: int, limit: int = MAX_READ) -> Tuple[List[str], int, int, int]:
+    """Return (lines, start, next_offset, end) for complete lines after offset.
+
+    A partial last line is left for the next call; pass next_offset back
+    as the cursor. Offsets that fell off the retained segments resume at
+    the oldest data still on disk; one past the end (log reset) does too.
+    `start` is where the read actually began, so callers can tell.
+    """
+    parts = pieces(path)
+    end = parts[-1].end
+    limit = max(1, min(limit, MAX_READ))
+    if offset > end or offset < parts[0].start:
+        offset = parts[0].start
+    piece = next((p for p in parts if p.start <= offset < p.end), None)
+    if piece is None:
+        return [], offset, offset, end
+    data = piece.read(offset - piece.start, min(limit, piece.end - offset))
+    cut = data.rfind(b"\n") + 1
+    if cut == 0 and len(data) < limit and piece is parts[-1]:
+        # only an unterminated line so far; wait for the rest
+        return [], offset, offset, end
+    if cut == 0:
+        # single line longer than the limit: hand it out in pieces
+        cut = len(data)
+    return _decode(data[:cut]), offset, offset + cut, end
+
+
+def log_extent(path: str) -> Tuple[int, int]:
+    """(first retained offset, end offset) of the whole log."""
+    parts = pieces(path)
+    return parts[0].start, parts[-1].end
+
+
+def read_range(path: str, start: int, length: int) -> bytes:
+    """Read global bytes [start, start+length) across segment boundaries."""
+    out = []
+    stop = start + length
+    for piece in pieces(path):
+        if piece.end <= start or piece.start >= stop:
+            continue
+        lo = max(start, piece.start)
+        hi = min(stop, piece.end)
+        out.append(piece.read(lo - piece.start, hi - lo))
+    return b"".join(out)
+
+
+def _read(fh, start: int, length: int) -> bytes:
+    if length <= 0:
+        return b""
+    size = os.fstat(fh.fileno()).st_size
+    if size >= MMAP_THRESHOLD:
+        with mmap.mmap(fh.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            return mm[start:start + length]
+    return os.pread(fh.fileno(), length, start)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=a-b' Range header into (start, end_inclusive).
+
+    Returns None for anything unsatisfiable or unsupported (multi-range).
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m or size == 0:
+        return None
+    first, last = m.group(1), m.group(2)
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # suffix range: the last N bytes
+        length = min(int(last), size)
+        if length == 0:
+            return None
+        return size - length, size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
@@ -0,0 +1,340 @@
+# app/logstore.py
+import os
+import gzip
+import json
+import time
+import queue
+import select
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional
+
+from .tailer import Inotify, IN_MODIFY
+
+# Defaults for [logs] in manager_settings.toml
+ROTATE_MAX_BYTES = 10 * 1024 * 1024
+ROTATE_MAX_AGE = 24 * 3600
+KEEP_SEGMENTS = 10
+
+READ_CHUNK = 64 * 1024
+# Seconds between checks for age-based rotation (and polls without inotify)
+AGE_CHECK = 5.0
+POLL_INTERVAL = 0.2
+
+
+def index_path(active: str) -> str:
+    return active + ".segments.json"
+
+
+def load_index(active: str) -> dict:
+    try:
+        with open(index_path(active), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"next_seq": 1, "segments": []}
+
+
+class SegmentedLog:
+    """Append-only log split into numbered segments.
+
+    The bot appends to <dir>/bot.log itself (O_APPEND), so the file keeps
+    growing, and the bot keeps running, while no manager is there. When
+    it passes max_bytes or max_age the manager copies it to bot.log.<seq>,
+    truncates it in place (copytruncate) and queues the copy for gzip
+    compression. Offsets are global across segments; the index file
+    bot.log.segments.json records where every archived segment starts.
+    """
+
+    def __init__(self, path: str, max_bytes: int = ROTATE_MAX_BYTES,
+                 max_age: float = ROTATE_MAX_AGE, keep: int = KEEP_SEGMENTS):
+        self.path = path
+        self.dir = os.path.dirname(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.index = load_index(path)
+        try:
+            st = os.stat(path)
+            self.size = st.st_size
+            self.opened_at = st.st_mtime if self.size else time.time()
+        except OSError:
+            self.size = 0
+            self.opened_at = time.time()
+
+    @property
+    def base(self) -> int:
+        """Global offset where the active segment starts."""
+        segs = self.index["segments"]
+        if not segs:
+            return self.index.get("base", 0)
+        last = segs[-1]
+        return last["start"] + last["size"]
+
+    def configure(self, max_bytes: int, max_age: float, keep: int):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+
+    def observe(self, size: int):
+        """Record the active file's current size."""
+        if self.size == 0 and size:
+            self.opened_at = time.time()
+        self.size = size
+
+    def due(self) -> bool:
+        if self.size == 0:
+            return False
+        if self.max_bytes and self.size >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self.opened_at >= self.max_age
+
+    def rotate(self, seen: int) -> bytes:
+        """Archive the active file and empty it (copytruncate).
+
+        The bot keeps its O_APPEND descriptor and carries on at the start
+        of the emptied file. Anything it writes between the end of the
+        copy and the truncate is lost. Returns the archived bytes past
+        `seen`, so the caller can still pass them on.
+        """
+        with self._lock:
+            seq = self.index["next_seq"]
+            name = f"{os.path.basename(self.path)}.{seq}"
+            extra = []
+            copied = 0
+            with open(self.path, "rb") as src, open(os.path.join(self.dir, name), "wb") as dst:
+                # read to EOF, so what the bot wrote during the copy is in it
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    dst.write(chunk)
+                    if copied + len(chunk) > seen:
+                        extra.append(chunk[max(0, seen - copied):])
+                    copied += len(chunk)
+                os.truncate(self.path, 0)
+            self.index["segments"].append({
+                "seq": seq,
+                "file": name,
+                "start": self.base,
+                "size": copied,
+                "opened_at": self.opened_at,
+                "closed_at": time.time(),
+                "compressed": False,
+            })
+            self.index["next_seq"] = seq + 1
+            self.size = 0
+            self.opened_at = time.time()
+            self._prune()
+            self._save()
+        compressor.submit(self, seq)
+        return b"".join(extra)
+
+    def _prune(self):
+        segs = self.index["segments"]
+        while self.keep and len(segs) > self.keep:
+            old = segs.pop(0)
+            # keep global offsets stable after the oldest segment is gone
+            if not segs:
+                self.index["base"] = old["start"] + old["size"]
+            for fname in (old["file"], old["file"] + ".gz"):
+                try:
+                    os.unlink(os.path.join(self.dir, fname))
+                except OSError:
+                    pass
+
+    def _save(self):
+        tmp = index_path(self.path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, index_path(self.path))
+
+    def _compress(self, seq: int):
+        """Runs on the compressor thread."""
+        with self._lock:
+            seg = next((s for s in self.index["segments"] if s["seq"] == seq), None)
+            if seg is None or seg["compressed"]:
+                return
+            src = os.path.join(self.dir, seg["file"])
+        dst = src + ".gz"
+        try:
+            with open(src, "rb") as fi, gzip.open(dst + ".tmp", "wb", compresslevel=6) as fo:
+                shutil.copyfileobj(fi, fo, 1024 * 1024)
+            os.replace(dst + ".tmp", dst)
+        except OSError as e:
+            print(f"Log compression failed for {src}: {e}")
+            return
+        with self._lock:
+            seg = next((s for s in self.index["segments"] if s["seq"] == seq), None)
+            if seg is None:
+                # pruned while we were compressing
+                os.unlink(dst)
+                return
+            seg["compressed"] = True
+            self._save()
+        try:
+            os.unlink(src)
+        except OSError:
+            pass
+
+
+class _Compressor:
+    """Background worker that gzips rotated segments off the write path."""
+
+    def __init__(self):
+        self.q: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, log: SegmentedLog, seq: int):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-compressor", daemon=True)
+            self._thread.start()
+        self.q.put((log, seq))
+
+    def _run(self):
+        while True:
+            log, seq = self.q.get()
+            try:
+                log._compress(seq)
+            except Exception as e:
+                print(f"Log compression error: {e}")
+
+
+compressor = _Compressor()
+
+
+class _Follow:
+    def __init__(self, bot_id: str, log: SegmentedLog, fh, pos: int,
+                 listeners: List[Callable[[bytes], None]], on_eof: Optional[Callable[[], None]]):
+        self.bot_id = bot_id
+        self.log = log
+        self.fh = fh
+        self.pos = pos
+        self.listeners = listeners
+        self.on_eof = on_eof
+        self.wd: Optional[int] = None
+
+
+class LogPump:
+    """One thread that follows every running bot's log file.
+
+    Bots write bot.log themselves, so they outlive the manager; the pump
+    only reads. It wakes on inotify (or polls when that is unavailable),
+    hands new bytes to listeners (callables taking the raw bytes) and
+    rotates the file once its SegmentedLog is due.
+    """
+
+    def __init__(self):
+        self.bytes_in: Dict[str, int] = {}
+        self._follows: Dict[str, _Follow] = {}
+        self._by_wd: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        try:
+            self._notify: Optional[Inotify] = Inotify(mask=IN_MODIFY)
+        except OSError:
+            self._notify = None
+        self._rfd, self._wfd = os.pipe()
+        os.set_blocking(self._rfd, False)
+        os.set_blocking(self._wfd, False)
+        self._thread = threading.Thread(target=self._run, name="log-pump", daemon=True)
+        self._thread.start()
+
+    def attach(self, bot_id: str, log: SegmentedLog, offset: int,
+               listeners: Optional[List[Callable[[bytes], None]]] = None,
+               on_eof: Optional[Callable[[], None]] = None):
+        """Follow `log` from `offset` in its active file."""
+        self.detach(bot_id)
+        os.makedirs(log.dir, exist_ok=True)
+        open(log.path, "ab").close()
+        fh = open(log.path, "rb", buffering=0)
+        fh.seek(min(offset, os.fstat(fh.fileno()).st_size))
+        f = _Follow(bot_id, log, fh, fh.tell(), listeners or [], on_eof)
+        with self._lock:
+            if self._notify is not None:
+                try:
+                    f.wd = self._notify.add(log.dir)
+                    self._by_wd[f.wd] = bot_id
+                except OSError as e:
+                    print(f"inotify watch failed for {log.dir}, polling: {e}")
+            self._follows[bot_id] = f
+        self._wake()
+
+    def detach(self, bot_id: str):
+        """Stop following a bot: read what is left, then call on_eof."""
+        with self._lock:
+            f = self._follows.pop(bot_id, None)
+            if f is None:
+                return
+            if f.wd is not None:
+                self._by_wd.pop(f.wd, None)
+                try:
+                    self._notify.remove(f.wd)
+                except OSError:
+                    pass
+            try:
+                self._drain(f)
+            except OSError as e:
+                print(f"Log follow failed for {bot_id}: {e}")
+            f.fh.close()
+        if f.on_eof is not None:
+            f.on_eof()
+
+    def _wake(self):
+        try:
+            os.write(self._wfd, b"\0")
+        except OSError:
+            pass
+
+    def _run(self):
+        fds = [self._rfd] + ([self._notify.fileno()] if self._notify is not None else [])
+        # inotify covers new data; the timeout catches age-based rotation
+        timeout = AGE_CHECK if self._notify is not None else POLL_INTERVAL
+        while True:
+            try:
+                ready, _, _ = select.select(fds, [], [], timeout)
+            except InterruptedError:
+                continue
+            if self._rfd in ready:
+                try:
+                    while os.read(self._rfd, 4096):
+                        pass
+                except (BlockingIOError, OSError):
+                    pass
+            touched = None
+            if self._notify is not None and self._notify.fileno() in ready:
+                touched = {wd for wd, _mask, _name in self._notify.read_events()}
+            with self._lock:
+                if touched is None:
+                    follows = list(self._follows.values())
+                else:
+                    follows = [self._follows[self._by_wd[wd]] for wd in touched if wd in self._by_wd]
+                for f in follows:
+                    try:
+                        self._drain(f)
+                    except OSError as e:
+                        print(f"Log follow failed for {f.bot_id}: {e}")
+
+    def _drain(self, f: _Follow):
+        # caller holds self._lock
+        if os.fstat(f.fh.fileno()).st_size < f.pos:
+            # truncated by someone else; start over
+            f.fh.seek(0)
+            f.pos = 0
+        while True:
+            data = f.fh.read(READ_CHUNK)
+            if not data:
+                break
+            f.pos += len(data)
+            self._deliver(f, data)
+        f.log.observe(f.pos)
+        if f.log.due():
+            extra = f.log.rotate(f.pos)
+            f.fh.seek(0)
+            f.pos = 0
+            if extra:
+                self._deliver(f, extra)
+
+    def _deliver(self, f: _Follow, data: bytes):
+        self.bytes_in[f.bot_id] = self.bytes_in.get(f.bot_id, 0) + len(data)
+        for fn in f.listeners:
+            try:
+                fn(data)
+            except Exception as e:
+                print(f"Log listener error for {f.bot_id}: {e}")
@@ -1,16 +1,28 @@
 # app/manager.py
 import os
+import copy
 import json
+import math
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import tomli
 import tomli_w
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Body
-from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Body, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from .bots_manager import BotRegistry
+from .bots_manager import BotRegistry, DISCUM_TEMPLATE, INSTANCES_DIR
+from .cluster import ClusterNode, SQLiteClusterStore
+from .templatestore import is_version
+from .broadcast import StatusBroadcaster
+from .lifecycle import (LifecycleEngine, ACTIONS, BATCH_CONCURRENCY,
+                        UPGRADE_BATCH_SIZE, UPGRADE_HEALTH_SECONDS)
+from .configwrite import ConfigWriter, infer_schema_from_toml
+from .metrics import MetricsSampler, PROMETHEUS_TYPE, OPENMETRICS_TYPE
+from .timeseries import parse_range
+from .utils import atomic_write
+from . import logread, wire
 
 app = FastAPI(title="Bot Manager")
 
@@ -19,10 +31,22 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 BOTS_DIR = os.path.join(DATA_DIR, "bots")
 os.makedirs(BOTS_DIR, exist_ok=True)
 
-reg = BotRegistry()
-
 # Load manager settings
 MANAGER_SETTINGS_PATH = os.path.join(DATA_DIR, "manager_settings.toml")
+DEFAULT_MANAGER_SETTINGS = {
+    "ui": {"theme": "dark", "refresh_interval": 2000},
+    "logs": {"max_lines": 1000, "auto_scroll": True, "buffer_size": 8192,
+             "batch_ms": 50, "batch_bytes": 65536, "max_pending_bytes": 1048576,
+             "rotate_max_bytes": 10485760, "rotate_max_age": 86400, "keep_segments": 10},
+    "web": {"host": "0.0.0.0", "port": 8080},
+    "launch": {"zygote": False},
+    "scheduler": {"max_concurrent": 4, "jitter_seconds": 0},
+    "restart": {"policy": "never", "backoff_initial": 1.0, "backoff_max": 300.0,
+                "reset_after": 60.0, "crash_loop_max": 5, "crash_loop_window": 120.0},
+    "cgroups": {"enabled": False, "parent": "bot-manager"},
+    "provision": {"mode": "copy"},
+    "cluster": {"enabled": False}
+}
 manager_settings = {}
 
 def load_manager_settings():
@@ -33,24 +57,69 @@ def load_manager_settings():
                 manager_settings = tomli.load(f)
         else:
             # Create default settings file
-            default_settings = {
-                "ui": {"theme": "dark", "refresh_interval": 2000},
-                "logs": {"max_lines": 1000, "auto_scroll": True, "buffer_size": 8192},
-                "web": {"host": "0.0.0.0", "port": 8080}
-            }
+            default_settings = copy.deepcopy(DEFAULT_MANAGER_SETTINGS)
             with open(MANAGER_SETTINGS_PATH, "wb") as f:
                 tomli_w.dump(default_settings, f)
             manager_settings = default_settings
     except Exception as e:
         print(f"Error loading manager settings: {e}")
-        manager_settings = {
-            "ui": {"theme": "dark", "refresh_interval": 2000},
-            "logs": {"max_lines": 1000, "auto_scroll": True, "buffer_size": 8192},
-            "web": {"host": "0.0.0.0", "port": 8080}
-        }
+        manager_settings = copy.deepcopy(DEFAULT_MANAGER_SETTINGS)
 
 load_manager_settings()
 
+reg = BotRegistry(settings=manager_settings)
+
+# One shared producer for every /ws/status connection
+status_feed = StatusBroadcaster(
+    reg.snapshot,
+    interval=manager_settings.get("ui", {}).get("refresh_interval", 2000) / 1000.0
+)
+
+# start/stop/restart run here and return a job handle right away
+lifecycle = LifecycleEngine(reg)
+lifecycle.on_event.append(status_feed.publish_event)
+
+# With [cluster] enabled, several manager processes (uvicorn --workers N)
+# split the bots between them through leases in a shared SQLite file
+cluster = None
+if manager_settings.get("cluster", {}).get("enabled", False):
+    cluster_db = manager_settings["cluster"].get("path") or str(INSTANCES_DIR / "cluster.sqlite")
+    cluster = ClusterNode(reg, lifecycle, SQLiteClusterStore(cluster_db))
+
+# PUT /config goes through here: one writer per bot, bursts coalesced
+config_writer = ConfigWriter(reg)
+
+# upper bound for one bulk POST /api/bots
+MAX_BULK_CREATE = 1000
+
+# open /ws/logs/{bot_id} connections
+log_ws_clients = 0
+
+# /metrics is rendered on this timer; scrapes get the cached text
+metrics = MetricsSampler(reg, interval=reg.supervisor.interval, gauges={
+    "manager_ws_clients": lambda: [
+        ({"endpoint": "status"}, len(status_feed.subscribers)),
+        ({"endpoint": "logs"}, log_ws_clients),
+        ({"endpoint": "manager_logs"}, len(manager_log_clients)),
+    ],
+})
+
+@app.on_event("startup")
+async def start_status_feed():
+    lifecycle.attach(asyncio.get_running_loop())
+    if cluster is not None:
+        await asyncio.to_thread(cluster.beat)
+        cluster.start()
+    status_feed.start()
+    metrics.start()
+
+@app.on_event("shutdown")
+async def stop_status_feed():
+    await status_feed.stop()
+    if cluster is not None:
+        await cluster.stop()
+    await asyncio.to_thread(reg.history.save)
+
 # serve static UI
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/ui", StaticFiles(directory=STATIC_DIR, html=True), name="ui")
@@ -77,211 +146,434 @@ def update_manager_settings(payload: Dict[str, Any] = Body(...)):
                 manager_settings[key] = value
         
         # Save settings to file
-        with open(MANAGER_SETTINGS_PATH, "wb") as f:
-            tomli_w.dump(manager_settings, f)
+        atomic_write(MANAGER_SETTINGS_PATH, tomli_w.dumps(manager_settings).encode("utf-8"))
         
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# -------- Helpers --------
-def infer_schema_from_toml(data: Any) -> dict:
-    if isinstance(data, dict):
-        return {"type":"object","properties":{k:infer_schema_from_toml(v) for k,v in data.items()}}
-    if isinstance(data, bool): return {"type":"boolean"}
-    if isinstance(data, int): return {"type":"integer"}
-    if isinstance(data, float): return {"type":"number"}
-    if isinstance(data, list):
-        if all(isinstance(x, str) for x in data):
-            return {"type":"array","items":{"type":"string"}}
-        return {"type":"array","items":{"type":"any"}}
-    return {"type":"string"}
-
-def coerce(schema: dict, payload: Any) -> Any:
-    t = schema.get("type")
-    if t == "object":
-        out = {}
-        for k, sub in schema.get("properties", {}).items():
-            if k in payload:
-                out[k] = coerce(sub, payload[k])
-        # Include any extra keys (be flexible)
-        for k, v in payload.items():
-            if k not in out:
-                out[k] = v
-        return out
-    if t == "boolean":
-        v = payload
-        if isinstance(v, str): return v.lower() in ("true","1","yes","on")
-        return bool(v)
-    if t == "integer": return int(payload)
-    if t == "number": return float(payload)
-    if t == "array":
-        v = payload
-        if isinstance(v, str):
-            return [x.strip() for x in v.splitlines() if x.strip()]
-        if isinstance(v, list): return v
-        return [v]
-    return "" if payload is None else str(payload)
-
 # ---------- REST: bots ----------
 @app.get("/api/bots")
 def list_bots():
     return reg.snapshot()
 
 @app.post("/api/bots")
-def create_bot(req: Dict[str, str] = Body(...)):
+def create_bot(req: Dict[str, Any] = Body(...)):
     name = req.get("name","Bot")
+    if "count" in req or "names" in req:
+        # bulk: {"names": [...]} or {"name": "Bot", "count": N} -> "Bot 1".."Bot N"
+        names = req.get("names")
+        if names:
+            if not isinstance(names, list):
+                raise HTTPException(status_code=400, detail="names must be a list")
+            count = len(names)
+        elif "count" in req:
+            try:
+                count = int(req["count"])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="count must be an integer")
+        else:
+            raise HTTPException(status_code=400, detail="names is empty and no count was given")
+        # checked before any name is built
+        if not 1 <= count <= MAX_BULK_CREATE:
+            raise HTTPException(status_code=400, detail=f"between 1 and {MAX_BULK_CREATE} bots per call")
+        if not names:
+            names = [f"{name} {i}" for i in range(1, count + 1)]
+        return {"ids": reg.create_many([str(n) for n in names])}
     bot_id = reg.create_from_template(name)
     return {"id": bot_id}
 
 @app.delete("/api/bots/{bot_id}")
 def delete_bot(bot_id: str):
+    if not reg.owns(bot_id):
+        c = cluster.call_sync(bot_id, "delete", 60)
+        if c["state"] != "done":
+            raise RuntimeError(c["result"].get("error") or "delete failed")
+        return {"ok": True}
     reg.delete(bot_id)
     return {"ok": True}
 
 @app.post("/api/bots/{bot_id}/start")
-def start_bot(bot_id: str):
-    reg.start(bot_id)
-    return {"ok": True}
+async def start_bot(bot_id: str):
+    job = lifecycle.submit(bot_id, "start")
+    return {"ok": True, "job": job.as_dict()}
 
 @app.post("/api/bots/{bot_id}/stop")
-def stop_bot(bot_id: str):
-    reg.stop(bot_id)
-    return {"ok": True}
+async def stop_bot(bot_id: str):
+    job = lifecycle.submit(bot_id, "stop")
+    return {"ok": True, "job": job.as_dict()}
 
 @app.post("/api/bots/{bot_id}/restart")
-def restart_bot(bot_id: str):
-    reg.restart(bot_id)
-    return {"ok": True}
+async def restart_bot(bot_id: str):
+    job = lifecycle.submit(bot_id, "restart")
+    return {"ok": True, "job": job.as_dict()}
+
+def _number(req: Dict[str, Any], key: str, default, kind=int, minimum=1):
+    # a numeric body field, or a 400 instead of a 500 (or a batch that never moves)
+    try:
+        value = kind(req.get(key, default))
+    except (TypeError, ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail=f"{key} must be a number")
+    if not math.isfinite(value) or value < minimum:
+        raise HTTPException(status_code=400, detail=f"{key} must be at least {minimum}")
+    return value
+
+async def _target_ids(req: Dict[str, Any]) -> Optional[list]:
+    # "ids": [...] or "selector": {"labels": {...}}; None if neither is given
+    if "ids" in req:
+        if not isinstance(req["ids"], list):
+            raise HTTPException(status_code=400, detail="ids must be a list")
+        return [str(x) for x in req["ids"]]
+    if "selector" in req:
+        sel = req["selector"]
+        if not isinstance(sel, dict) or not isinstance(sel.get("labels", {}), dict):
+            raise HTTPException(status_code=400, detail='selector must be {"labels": {...}}')
+        return await asyncio.to_thread(reg.select, sel.get("labels", {}))
+    return None
+
+@app.post("/api/bots:batch")
+async def batch_bots(req: Dict[str, Any] = Body(...)):
+    """Run one action across many bots.
+
+    Body: {"action": "start|stop|restart", "ids": [...]} or
+    {"action": ..., "selector": {"labels": {"key": "value"}}}, plus optional
+    "concurrency" and "stagger_ms". Streams one JSON line per finished bot
+    and a final {"done": true, ...} summary line.
+    """
+    action = req.get("action")
+    if action not in ACTIONS:
+        raise HTTPException(status_code=400, detail=f"action must be one of {', '.join(ACTIONS)}")
+    concurrency = _number(req, "concurrency", BATCH_CONCURRENCY)
+    stagger = _number(req, "stagger_ms", 0, float, 0) / 1000.0
+    ids = await _target_ids(req)
+    if ids is None:
+        raise HTTPException(status_code=400, detail="ids or selector required")
+
+    async def stream():
+        started = asyncio.get_running_loop().time()
+        counts = {"done": 0, "failed": 0}
+        async for job in lifecycle.run_batch(ids, action, concurrency, stagger):
+            counts["done" if job.state == "done" else "failed"] += 1
+            yield json.dumps({"bot": job.bot_id, "job": job.as_dict()}) + "\n"
+        elapsed = asyncio.get_running_loop().time() - started
+        yield json.dumps({"done": True, "ok": counts["done"], "failed": counts["failed"],
+                          "elapsed": round(elapsed, 3)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+def metrics_endpoint(request: Request):
+    # OpenMetrics when the scraper asks for it, Prometheus text otherwise
+    om = "application/openmetrics-text" in request.headers.get("accept", "")
+    return Response(metrics.render(om), media_type=OPENMETRICS_TYPE if om else PROMETHEUS_TYPE)
+
+@app.get("/api/bots/{bot_id}/metrics")
+def bot_metrics(bot_id: str, range: str = "1h", points: int = 0):
+    # CPU/memory history, e.g. ?range=24h&points=300
+    reg._get(bot_id)
+    try:
+        seconds = parse_range(range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return reg.history.query(bot_id, seconds, points)
+
+@app.get("/api/scheduler")
+def scheduler_stats():
+    # Lateness/duration per scheduled job, plus queue depth
+    return reg.actions.snapshot()
+
+@app.get("/api/cluster")
+def cluster_status():
+    # which worker holds which share of the bots
+    if cluster is None:
+        return {"enabled": False}
+    return {"enabled": True, "worker": cluster.id, "shards": sorted(cluster.shards),
+            "workers": cluster.store.workers()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    # ?wait=N long-polls up to N seconds for the job to finish
+    try:
+        job = lifecycle.get(job_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="job not found")
+    if wait > 0 and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), min(wait, 60))
+        except asyncio.TimeoutError:
+            pass
+    return job.as_dict()
+
+# ---------- REST: template versions ----------
+@app.get("/api/templates")
+def list_templates():
+    # stored versions and how many bots use each; "current" is the template on disk
+    counts: Dict[str, int] = {}
+    for b in list(reg.bots.values()):
+        counts[b.version] = counts.get(b.version, 0) + 1
+    versions = reg.templates.versions()
+    for v in versions:
+        v["bots"] = counts.get(v["version"], 0)
+    return {"current": reg.templates.version_of(DISCUM_TEMPLATE), "versions": versions,
+            "unversioned_bots": counts.get(None, 0)}
+
+@app.post("/api/templates/snapshot")
+def snapshot_template():
+    return {"version": reg.templates.snapshot(DISCUM_TEMPLATE)}
+
+@app.post("/api/templates/prune")
+def prune_templates():
+    # drop versions no bot links to (the current template is kept)
+    keep = {b.version for b in list(reg.bots.values()) if b.version}
+    keep.add(reg.templates.version_of(DISCUM_TEMPLATE))
+    return {"removed": reg.templates.prune(keep)}
+
+@app.post("/api/templates/upgrade")
+async def upgrade_template(req: Dict[str, Any] = Body(...)):
+    """Rolling upgrade of bots to a template version.
+
+    Body: optional "version" (default: snapshot of the current template),
+    "ids" or "selector" (default: every bot), "batch_size", "concurrency",
+    "health_seconds" and "rollback". Bots with their own copy of the code
+    are skipped unless "include_unversioned" is true. Returns the upgrade
+    right away; poll GET /api/upgrades/{id}.
+    """
+    batch_size = _number(req, "batch_size", UPGRADE_BATCH_SIZE)
+    concurrency = _number(req, "concurrency", batch_size)
+    health_seconds = _number(req, "health_seconds", UPGRADE_HEALTH_SECONDS, float, 0)
+    version = req.get("version") or await asyncio.to_thread(reg.templates.snapshot, DISCUM_TEMPLATE)
+    if not is_version(version):
+        raise HTTPException(status_code=400, detail="version must be a template version hash")
+    if not reg.templates.exists(version):
+        raise HTTPException(status_code=404, detail=f"Unknown template version: {version}")
+    ids = await _target_ids(req)
+    if ids is None:
+        ids = list(reg.bots)
+    # bots already on this version have nothing to do
+    ids = [b for b in ids if b not in reg.bots or reg.bots[b].version != version]
+    skipped = []
+    if not req.get("include_unversioned", False):
+        # relinking a private copy replaces that code for good; a rollback
+        # has nothing to go back to
+        skipped = [b for b in ids if b in reg.bots and reg.bots[b].version is None]
+        ids = [b for b in ids if b not in skipped]
+    try:
+        u = lifecycle.start_upgrade(
+            ids, version,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            health_seconds=health_seconds,
+            rollback=bool(req.get("rollback", True)))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Not found: {e}")
+    return {"ok": True, "upgrade": u.as_dict(), "skipped": skipped}
+
+@app.get("/api/upgrades/{upgrade_id}")
+async def get_upgrade(upgrade_id: str, wait: float = 0):
+    try:
+        u = lifecycle.get_upgrade(upgrade_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Unknown upgrade")
+    if wait > 0 and not u.done.is_set():
+        try:
+            await asyncio.wait_for(u.done.wait(), min(wait, 60))
+        except asyncio.TimeoutError:
+            pass
+    return u.as_dict()
 
 # ---------- REST: config (dynamic) ----------
 @app.get("/api/bots/{bot_id}/config")
 def get_config(bot_id: str):
     cfg_path = reg.config_path(bot_id)
-    data = {}
-    if os.path.exists(cfg_path):
-        with open(cfg_path, "rb") as f:
-            data = tomli.load(f)
-    schema = infer_schema_from_toml(data if data else {"_":""})
+    data = reg.configs.load(cfg_path)
+    schema = reg.configs.schema(cfg_path) if data else infer_schema_from_toml({"_":""})
     return {"config": data, "schema": schema}
 
 @app.put("/api/bots/{bot_id}/config")
 def put_config(bot_id: str, payload: Dict[str, Any] = Body(...)):
-    cfg_path = reg.config_path(bot_id)
-    current = {}
-    if os.path.exists(cfg_path):
-        with open(cfg_path, "rb") as f:
-            current = tomli.load(f)
-    schema = infer_schema_from_toml(current if current else payload)
-    coerced = coerce(schema, payload)
-
-    with open(cfg_path, "wb") as f:
-        tomli_w.dump(coerced, f)
-
-    reg._apply_schedules(bot_id)
+    try:
+        config_writer.write(bot_id, payload)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="bot not found")
     return {"ok": True}
 
 # ---------- Logs ----------
+# Whole-file reads are avoided: logs.txt returns the last N lines (or a
+# byte range), and the JSON endpoints page through the file by offset.
+# Tails are capped at logread.MAX_TAIL_LINES lines, ranges at MAX_READ bytes.
 @app.get("/api/bots/{bot_id}/logs.txt", response_class=PlainTextResponse)
-def read_log(bot_id: str):
+def read_log(bot_id: str, request: Request, lines: Optional[int] = None):
     b = reg._get(bot_id)
-    if not os.path.exists(b.logfile):
-        return ""
+    path = str(b.logfile)
     try:
-        with open(b.logfile, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
+        range_header = request.headers.get("range")
+        if range_header:
+            # Offsets are global across rotated segments
+            first, size = logread.log_extent(path)
+            rng = logread.parse_range(range_header, size)
+            if rng is None:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            start, end = rng
+            start = max(start, first)
+            if start > end:
+                # asked only for data that has already been pruned
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            end = min(end, start + logread.MAX_READ - 1)
+            data = logread.read_range(path, start, end - start + 1)
+            return Response(
+                data, status_code=206, media_type="text/plain; charset=utf-8",
+                headers={"Content-Range": f"bytes {start}-{start + len(data) - 1}/{size}",
+                         "Accept-Ranges": "bytes"}
+            )
+        n = lines or manager_settings.get("logs", {}).get("max_lines", 1000)
+        out, _start, end = logread.read_tail(path, n)
+        return PlainTextResponse(
+            "\n".join(out) + ("\n" if out else ""),
+            headers={"X-Log-Offset": str(end), "Accept-Ranges": "bytes"}
+        )
     except Exception as e:
         return f"LOG ERROR: {e}"
 
+@app.get("/api/bots/{bot_id}/logs/tail")
+def tail_log(bot_id: str, lines: int = 100):
+    b = reg._get(bot_id)
+    out, start, end = logread.read_tail(str(b.logfile), max(0, lines))
+    # "next" is the cursor for /logs/range to continue from
+    return {"lines": out, "start": start, "next": end}
+
+@app.get("/api/bots/{bot_id}/logs/range")
+def range_log(bot_id: str, offset: int = 0, limit: int = 65536):
+    b = reg._get(bot_id)
+    out, start, nxt, size = logread.read_from(str(b.logfile), max(0, offset), limit)
+    # "offset" is where the lines really start; "truncated" means the
+    # requested offset had already been rotated away (or was past the end)
+    return {"lines": out, "offset": start, "next": nxt, "size": size,
+            "truncated": start != max(0, offset)}
+
 @app.get("/api/bots/{bot_id}/logs")
 def download_log(bot_id: str):
     b = reg._get(bot_id)
     if not os.path.exists(b.logfile):
         return PlainTextResponse("", media_type="text/plain")
-    return FileResponse(b.logfile, filename=f"{bot_id}.log")
+    # every retained segment in order, decompressed, then the active one
+    return StreamingResponse(logread.iter_log(str(b.logfile)), media_type="text/plain",
+                             headers={"Content-Disposition": f'attachment; filename="{bot_id}.log"'})
 
 # ---------- WS: status feed (lower frequency to avoid UI jank) ----------
-status_clients = set()
-
+# First frame is {"type": "snapshot", "bots": [...]}, then
+# {"type": "diff", "changed": [...], "removed": [...]} whenever something moves.
+# ?format=msgpack|binary switches to compact binary frames (see wire.py).
 @app.websocket("/ws/status")
-async def ws_status(ws: WebSocket):
+async def ws_status(ws: WebSocket, format: Optional[str] = None):
     await ws.accept()
-    status_clients.add(ws)
     try:
-        while True:
-            await ws.send_text(json.dumps(reg.snapshot()))
-            await asyncio.sleep(2.0)  # 2s — smoother and lighter
+        await status_feed.serve(ws, wire.negotiate(format))
     except WebSocketDisconnect:
-        status_clients.discard(ws)
+        pass
+    except Exception as e:
+        print(f"Status WebSocket error: {e}")
 
 # ---------- WS: live log tail ----------
-from .utils import tail_f
+from .tailer import hub as tail_hub
+from .utils import wait_disconnect
 
 @app.websocket("/ws/logs/{bot_id}")
-async def ws_logs(ws: WebSocket, bot_id: str):
-    print(f"WebSocket connection request for bot logs: {bot_id}")  # Debug log
+async def ws_logs(ws: WebSocket, bot_id: str, batch_ms: Optional[int] = None,
+                  batch_bytes: Optional[int] = None, format: Optional[str] = None):
+    # Lines are packed into frames joined by "\n": everything that arrives
+    # within batch_ms (up to batch_bytes per frame) goes out together.
+    # batch_ms=0 sends one frame per line. Frames are compressed when the
+    # client negotiates permessage-deflate (uvicorn --ws-per-message-deflate).
+    # ?format=msgpack|binary sends a hello text frame, then binary frames
+    # (a msgpack array of lines, or raw UTF-8).
+    log_cfg = manager_settings.get("logs", {})
+    window = (log_cfg.get("batch_ms", 50) if batch_ms is None else batch_ms) / 1000.0
+    max_frame = (batch_bytes or log_cfg.get("batch_bytes", 65536)) if window > 0 else 0
+    max_pending = log_cfg.get("max_pending_bytes", 1048576)
+    fmt = wire.negotiate(format)
+
+    global log_ws_clients
     await ws.accept()
-    print(f"WebSocket connection accepted for bot logs: {bot_id}")  # Debug log
+    log_ws_clients += 1
+    sub = None
+    watcher = None
     try:
+        if fmt != "json":
+            await ws.send_text(json.dumps({"type": "hello", "format": fmt}))
         b = reg._get(bot_id)
-        logfile_path = str(b.logfile)
-        
-        # Debug: Print the logfile path
-        print(f"Attempting to tail log file: {logfile_path}")
-        
-        # Check if log file exists, if not, wait for it to be created
-        max_wait_time = 30  # seconds
-        wait_interval = 0.5  # seconds
-        wait_count = 0
-        
-        while not os.path.exists(logfile_path) and wait_count < (max_wait_time / wait_interval):
-            print(f"Waiting for log file to exist: {logfile_path}")  # Debug log
-            await asyncio.sleep(wait_interval)
-            wait_count += 1
-        
-        if not os.path.exists(logfile_path):
-            error_msg = f"Log file not found at {logfile_path}. Bot may not be started yet."
-            print(error_msg)
-            await ws.send_text(error_msg)
-            await asyncio.sleep(1)  # Give time for the message to be sent
-            return
-            
-        # Debug: Print file exists
-        print(f"Log file exists: {logfile_path}")
-        
-        async for line in tail_f(logfile_path):
-            try:
-                # Check if the WebSocket is still connected
-                if hasattr(ws, 'client_state') and ws.client_state == "connected":
-                    await ws.send_text(line.rstrip("\n"))
-                elif hasattr(ws, 'application_state') and not ws.application_state.name == "DISCONNECTED":
-                    await ws.send_text(line.rstrip("\n"))
-                else:
-                    print(f"WebSocket disconnected for bot {bot_id}")  # Debug log
-                    break
-            except Exception as e:
-                # Client disconnected or other WebSocket error
-                print(f"WebSocket send error for bot {bot_id}: {e}")  # Debug log
+        if not reg.owns(bot_id):
+            # Run by another cluster worker: follow the file
+            backlog = []
+            sub = tail_hub.subscribe(str(b.logfile), max_pending_bytes=max_pending)
+        else:
+            # Recent output comes from memory, then the live stream continues
+            # from the same ring without a gap
+            ring = b.ring if b.ring is not None and b.ring.seeded else \
+                await asyncio.to_thread(reg.log_ring, bot_id)
+            backlog, sub = ring.subscribe(max_pending_bytes=max_pending)
+        await _send_lines(ws, backlog, max_frame, fmt)
+        watcher = asyncio.create_task(wait_disconnect(ws))
+        watcher.add_done_callback(lambda _: sub.close())
+        loop = asyncio.get_running_loop()
+        last_send = 0.0
+        while True:
+            lines = await sub.get()
+            if not lines:
                 break
+            if window > 0:
+                # Sparse output goes out immediately; under load, wait out
+                # the rest of the window and pack whatever else arrived.
+                wait = window - (loop.time() - last_send)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    lines = lines + sub.get_nowait()
+            await _send_lines(ws, lines, max_frame, fmt)
+            last_send = loop.time()
     except WebSocketDisconnect:
-        print(f"WebSocket disconnected for bot {bot_id}")  # Debug log
         pass
+    except FileNotFoundError:
+        await _send_quietly(ws, f"Bot {bot_id} not found")
     except Exception as e:
-        error_msg = f"Error reading logs for bot {bot_id}: {str(e)}"
-        print(error_msg)  # Log to server console
-        try:
-            await ws.send_text(error_msg)
-        except:
-            pass
+        print(f"Error reading logs for bot {bot_id}: {e}")
+        await _send_quietly(ws, f"Error reading logs for bot {bot_id}: {e}")
     finally:
+        log_ws_clients -= 1
+        if watcher is not None:
+            watcher.cancel()
+        if sub is not None:
+            sub.close()
         try:
-            if hasattr(ws, 'client_state') and ws.client_state == "connected":
-                await ws.close()
-            elif hasattr(ws, 'application_state') and not ws.application_state.name == "DISCONNECTED":
-                await ws.close()
-        except Exception as e:
-            print(f"Error closing WebSocket for bot {bot_id}: {e}")  # Debug log
-        print(f"WebSocket connection closed for bot {bot_id}")  # Debug log
+            await ws.close()
+        except Exception:
+            pass
+
+async def _send_lines(ws: WebSocket, lines, max_frame: int, fmt: str = "json"):
+    # Pack lines into "\n"-joined frames of at most max_frame bytes
+    # (0 = one frame per line)
+    def send(frame):
+        if fmt == "json":
+            return ws.send_text("\n".join(frame))
+        return ws.send_bytes(wire.encode_lines(frame, fmt))
+
+    if not max_frame:
+        for line in lines:
+            await send([line])
+        return
+    frame, size = [], 0
+    for line in lines:
+        if frame and size + len(line) + 1 > max_frame:
+            await send(frame)
+            frame, size = [], 0
+        frame.append(line)
+        size += len(line) + 1
+    if frame:
+        await send(frame)
+
+async def _send_quietly(ws: WebSocket, text: str):
+    try:
+        await ws.send_text(text)
+    except Exception:
+        pass
 
 # ---------- WS: manager logs ----------
 import logging
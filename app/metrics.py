@@ -0,0 +1,177 @@
+# app/metrics.py
+import math
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .tailer import hub as tail_hub
+
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# (labels, value) pairs of one metric family
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+class MetricsSampler:
+    """Renders /metrics from in-memory state on a timer.
+
+    Everything read here is already cached elsewhere: supervisor rows, the
+    log pump's byte counters, the tail hub's line count (file tailers and
+    in-memory rings), scheduler and config cache stats. A scrape only
+    returns the last rendered text, so it never costs a syscall per bot;
+    before the first sample it is empty. Rates (log bytes/s, tail
+    lines/s) are deltas between two samples.
+    """
+
+    def __init__(self, registry, interval: float = 5.0,
+                 gauges: Optional[Dict[str, Callable[[], Samples]]] = None):
+        self.reg = registry
+        self.interval = interval
+        # extra manager gauges: name -> callable returning samples
+        self.gauges = gauges or {}
+        self._prev: Optional[Tuple[float, Dict[str, int], int]] = None
+        self._rates: Tuple[Dict[str, float], float] = ({}, 0.0)
+        self._text: Dict[bool, bytes] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Metrics sampler error: {e}")
+            time.sleep(self.interval)
+
+    def render(self, openmetrics: bool = False) -> bytes:
+        with self._lock:
+            text = self._text.get(openmetrics)
+        if text is None:
+            # the first sample is still being taken; never sample on a scrape
+            text = _render([], openmetrics)
+        return text
+
+    def sample(self):
+        now = time.monotonic()
+        log_bytes = dict(self.reg.pump.bytes_in)
+        tail_lines = tail_hub.lines_out
+        rates, tail_rate = self._rates
+        if self._prev is not None and now > self._prev[0]:
+            dt = now - self._prev[0]
+            rates = {b: (n - self._prev[1].get(b, 0)) / dt for b, n in log_bytes.items()}
+            tail_rate = (tail_lines - self._prev[2]) / dt
+        self._prev = (now, log_bytes, tail_lines)
+        self._rates = (rates, tail_rate)
+
+        families = self._collect(log_bytes, rates, tail_lines, tail_rate)
+        text = {om: _render(families, om) for om in (False, True)}
+        with self._lock:
+            self._text = text
+
+    def _collect(self, log_bytes, log_rates, tail_lines, tail_rate) -> list:
+        f = []
+        rows = self.reg.snapshot()
+        now = datetime.utcnow()
+
+        def per_bot(name, kind, help_, fn):
+            samples = []
+            for r in rows:
+                v = fn(r)
+                if v is not None:
+                    samples.append(({"bot": r["id"]}, v))
+            f.append((name, kind, help_, samples))
+
+        per_bot("bot_up", "gauge", "1 if the bot process is running",
+                lambda r: 1 if r["status"] != "stopped" else 0)
+        per_bot("bot_cpu_percent", "gauge", "CPU use over the last supervisor sample",
+                lambda r: r["cpu"])
+        per_bot("bot_memory_bytes", "gauge", "Resident memory (whole cgroup when enabled)",
+                lambda r: r["cgroup"]["memory_bytes"] if r.get("cgroup") else r["memory_mb"] * 1024 * 1024)
+        per_bot("bot_uptime_seconds", "gauge", "Seconds since the running process started",
+                lambda r: (now - datetime.fromisoformat(r["started_at"])).total_seconds()
+                if r["status"] != "stopped" and r["started_at"] else None)
+        per_bot("bot_restarts", "counter", "Automatic restarts by the restart policy",
+                lambda r: r["restart"]["restarts"])
+        per_bot("bot_starts", "counter", "Times the manager launched the bot",
+                lambda r: getattr(self.reg.bots.get(r["id"]), "starts", 0))
+        per_bot("bot_last_exit_code", "gauge", "Exit code of the last run (NaN if unknown)",
+                lambda r: math.nan if r["last_exit"] is None else r["last_exit"])
+        f.append(("bot_log_bytes", "counter", "Bytes of stdout/stderr written to the bot log",
+                  [({"bot": b}, n) for b, n in sorted(log_bytes.items())]))
+        f.append(("bot_log_bytes_per_second", "gauge", "Log output rate over the last sampling interval",
+                  [({"bot": b}, round(v, 3)) for b, v in sorted(log_rates.items())]))
+
+        f.append(("manager_bots", "gauge", "Bots known to the manager", [({}, len(rows))]))
+        f.append(("manager_snapshot_seconds", "gauge", "Duration of the last supervisor sample",
+                  [({}, self.reg.supervisor.sample_seconds)]))
+        f.append(("manager_tail_lines", "counter", "Log lines fanned out to /ws/logs followers",
+                  [({}, tail_lines)]))
+        f.append(("manager_tail_lines_per_second", "gauge", "Log fan-out rate over the last sampling interval",
+                  [({}, round(tail_rate, 3))]))
+
+        sched = self.reg.actions.snapshot()
+        f.append(("manager_scheduler_queued", "gauge", "Scheduled actions waiting to run",
+                  [({}, sched["queued"])]))
+        f.append(("manager_scheduler_running", "gauge", "Scheduled actions running now",
+                  [({}, sched["running"])]))
+        f.append(("manager_scheduler_lateness_seconds", "gauge", "Start delay of the last run of each job",
+                  [({"job": j}, st["lateness"]["last"]) for j, st in sorted(sched["jobs"].items())]))
+        f.append(("manager_scheduler_lateness_max_seconds", "gauge", "Worst start delay of each job",
+                  [({"job": j}, st["lateness"]["max"]) for j, st in sorted(sched["jobs"].items())]))
+
+        cache = self.reg.configs.stats()
+        lookups = cache["hits"] + cache["misses"]
+        f.append(("manager_config_cache_hits", "counter", "config.toml reads served from cache",
+                  [({}, cache["hits"])]))
+        f.append(("manager_config_cache_misses", "counter", "config.toml reads that parsed the file",
+                  [({}, cache["misses"])]))
+        f.append(("manager_config_cache_hit_ratio", "gauge", "Share of config reads served from cache",
+                  [({}, cache["hits"] / lookups if lookups else 0.0)]))
+
+        for name, fn in self.gauges.items():
+            try:
+                f.append((name, "gauge", "", fn()))
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {e}")
+        return f
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _value(v: float) -> str:
+    if isinstance(v, float):
+        if math.isnan(v):
+            return "NaN"
+        if math.isinf(v):
+            return "+Inf" if v > 0 else "-Inf"
+        return repr(v)
+    return str(v)
+
+
+def _render(families: list, openmetrics: bool) -> bytes:
+    out = []
+    for name, kind, help_, samples in families:
+        sample_name = name + "_total" if kind == "counter" else name
+        # OpenMetrics names the family, the 0.0.4 text format the sample
+        family = name if openmetrics else sample_name
+        if help_:
+            out.append(f"# HELP {family} {help_}")
+        out.append(f"# TYPE {family} {kind}")
+        for labels, value in samples:
+            if labels:
+                lbl = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                out.append(f"{sample_name}{{{lbl}}} {_value(value)}")
+            else:
+                out.append(f"{sample_name} {_value(value)}")
+    if openmetrics:
+        out.append("# EOF")
+    return ("\n".join(out) + "\n").encode("utf-8")
@@ -0,0 +1,123 @@
+# app/provision.py
+import os
+import errno
+import fcntl
+import shutil
+from pathlib import Path
+from typing import List, Tuple
+
+# How instance directories get the template's code:
+#   copy     - private copy of every file (the original behaviour)
+#   symlink  - links into the template; nothing is duplicated
+#   hardlink - same inode as the template file (same filesystem only)
+#   reflink  - copy-on-write clone where the filesystem supports it
+#   versioned - links through the instance's `template` symlink into a
+#               stored template version (see templatestore.py)
+MODES = ("copy", "symlink", "hardlink", "reflink", "versioned")
+MODE = "copy"
+
+# Per-instance files that are never shared with the template
+OWN_FILES = {"config.toml"}
+# Per-instance symlink to the template version in use (versioned mode)
+VERSION_LINK = "template"
+_SKIP_DIRS = {"__pycache__"}
+
+# linux/fs.h FICLONE
+_FICLONE = 0x40049409
+
+
+def template_files(template: Path) -> Tuple[List[str], List[str]]:
+    """(subdirectories, files) of a template, relative to it."""
+    dirs, files = [], []
+    for root, dnames, fnames in os.walk(template):
+        dnames[:] = [d for d in dnames if d not in _SKIP_DIRS]
+        rel = os.path.relpath(root, template)
+        for d in dnames:
+            dirs.append(os.path.normpath(os.path.join(rel, d)))
+        for f in fnames:
+            path = os.path.normpath(os.path.join(rel, f))
+            if path not in OWN_FILES:
+                files.append(path)
+    return dirs, files
+
+
+def populate(template: Path, dest: Path, layout: Tuple[List[str], List[str]], mode: str = MODE):
+    """Fill an existing, empty instance directory from the template."""
+    if mode == "versioned":
+        link_version(template, dest, layout)
+        return
+    dirs, files = layout
+    for d in dirs:
+        os.makedirs(dest / d, exist_ok=True)
+    src_root = os.path.abspath(template)
+    for rel in files:
+        src = os.path.join(src_root, rel)
+        dst = os.path.join(dest, rel)
+        if mode == "symlink":
+            os.symlink(src, dst)
+        elif mode == "hardlink":
+            try:
+                os.link(src, dst)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copy2(src, dst)
+        elif mode == "reflink":
+            _reflink(src, dst)
+        else:
+            shutil.copy2(src, dst)
+
+
+def link_version(version_dir: Path, dest: Path, layout: Tuple[List[str], List[str]],
+                 old_files=()):
+    """Point an instance at a stored template version.
+
+    Every code file is a relative link through dest/template, so moving
+    the instance to another version is one atomic swap of that link;
+    file links are only touched when the set of files differs. Files of
+    `old_files` the new version lacks are removed. Works on copied
+    instances too: their private copies are replaced by links.
+    """
+    dirs, files = layout
+    _replace_link(os.path.abspath(version_dir), os.path.join(dest, VERSION_LINK))
+    for d in dirs:
+        os.makedirs(dest / d, exist_ok=True)
+    for rel in files:
+        dst = os.path.join(dest, rel)
+        target = os.path.relpath(os.path.join(dest, VERSION_LINK, rel), os.path.dirname(dst))
+        if os.path.islink(dst) and os.readlink(dst) == target:
+            continue
+        _replace_link(target, dst)
+    keep = set(files)
+    for rel in old_files:
+        dst = os.path.join(dest, rel)
+        if rel not in keep and os.path.islink(dst):
+            os.unlink(dst)
+
+
+def instance_version(dest: Path):
+    """Template version an instance links to, or None for private code."""
+    try:
+        return os.path.basename(os.readlink(os.path.join(dest, VERSION_LINK)))
+    except OSError:
+        return None
+
+
+def _replace_link(target: str, path: str):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        os.unlink(tmp)
+    except FileNotFoundError:
+        pass
+    os.symlink(target, tmp)
+    os.replace(tmp, path)
+
+
+def _reflink(src: str, dst: str):
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        try:
+            fcntl.ioctl(fo.fileno(), _FICLONE, fi.fileno())
+        except OSError:
+            # filesystem without clone support: plain copy
+            shutil.copyfileobj(fi, fo, 1024 * 1024)
+    shutil.copystat(src, dst)
@@ -0,0 +1,164 @@
+# app/restarts.py
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+# Defaults for [restart] in manager_settings.toml; a bot's config.toml
+# [restart] table overrides them per bot
+POLICY = "never"           # always | on-failure | never
+BACKOFF_INITIAL = 1.0      # seconds before the first automatic restart
+BACKOFF_MAX = 300.0        # cap on the doubling delay
+RESET_AFTER = 60.0         # a run this long clears the failure streak
+CRASH_LOOP_MAX = 5         # this many exits...
+CRASH_LOOP_WINDOW = 120.0  # ...within this many seconds trips the breaker
+
+POLICIES = ("always", "on-failure", "never")
+
+
+class _BotState:
+    def __init__(self):
+        self.restarts = 0
+        self.streak = 0
+        self.exits: deque = deque()
+        self.breaker = False
+        self.next_restart: Optional[float] = None
+        self.timer: Optional[threading.Timer] = None
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.next_restart = None
+
+
+class RestartPolicyEngine:
+    """Restarts bots that exit on their own, per their restart policy.
+
+    The registry calls on_exit() as each exit is reaped: no polling. Each
+    unrequested exit doubles the delay before the next restart
+    (BACKOFF_INITIAL up to BACKOFF_MAX) until a run lasts RESET_AFTER
+    seconds. CRASH_LOOP_MAX exits inside CRASH_LOOP_WINDOW open the
+    breaker, which stays open until someone starts the bot by hand.
+    """
+
+    def __init__(self, registry):
+        self.reg = registry
+        self._lock = threading.Lock()
+        self.bots: Dict[str, _BotState] = {}
+        # bots we are starting ourselves; any other start is manual
+        self._own_starts: set = set()
+        registry.add_listener(self._on_event)
+
+    def policy(self, bot_id: str) -> dict:
+        base = self.reg.settings.get("restart", {})
+        try:
+            own = self.reg.configs.load(self.reg.config_path(bot_id)).get("restart", {})
+        except Exception:
+            own = {}
+
+        def get(key, default):
+            return own.get(key, base.get(key, default))
+
+        policy = get("policy", POLICY)
+        return {
+            "policy": policy if policy in POLICIES else POLICY,
+            "backoff_initial": float(get("backoff_initial", BACKOFF_INITIAL)),
+            "backoff_max": float(get("backoff_max", BACKOFF_MAX)),
+            "reset_after": float(get("reset_after", RESET_AFTER)),
+            "crash_loop_max": int(get("crash_loop_max", CRASH_LOOP_MAX)),
+            "crash_loop_window": float(get("crash_loop_window", CRASH_LOOP_WINDOW)),
+        }
+
+    def _on_event(self, bot_id: str, state: str, info: dict):
+        if state == "starting":
+            with self._lock:
+                own = bot_id in self._own_starts
+                self._own_starts.discard(bot_id)
+                st = self.bots.get(bot_id)
+                if st is not None and not own:
+                    # a manual start re-arms everything
+                    st.cancel()
+                    st.breaker = False
+                    st.streak = 0
+                    st.exits.clear()
+        elif state == "stopping":
+            with self._lock:
+                st = self.bots.get(bot_id)
+                if st is not None:
+                    st.cancel()
+
+    def on_exit(self, bot_id: str, code: Optional[int], requested: bool, uptime: Optional[float]):
+        if requested:
+            return
+        p = self.policy(bot_id)
+        if p["policy"] == "never" or (p["policy"] == "on-failure" and code == 0):
+            return
+        now = time.monotonic()
+        with self._lock:
+            st = self.bots.setdefault(bot_id, _BotState())
+            st.cancel()
+            if uptime is not None and uptime >= p["reset_after"]:
+                st.streak = 0
+            st.streak += 1
+            st.exits.append(now)
+            while st.exits and now - st.exits[0] > p["crash_loop_window"]:
+                st.exits.popleft()
+            if len(st.exits) >= p["crash_loop_max"]:
+                st.breaker = True
+            if st.breaker:
+                delay = None
+            else:
+                delay = min(p["backoff_initial"] * (2 ** (st.streak - 1)), p["backoff_max"])
+                st.next_restart = time.time() + delay
+                st.timer = threading.Timer(delay, self._restart, args=(bot_id, st))
+                st.timer.daemon = True
+                st.timer.start()
+        if delay is None:
+            print(f"Bot {bot_id} is crash-looping ({len(st.exits)} exits in "
+                  f"{p['crash_loop_window']:.0f}s); automatic restarts paused")
+            self.reg._emit(bot_id, "crash-loop", exits=len(st.exits))
+        else:
+            self.reg._emit(bot_id, "backoff", delay=round(delay, 3), streak=st.streak)
+        self.reg.supervisor.refresh(bot_id)
+
+    def _restart(self, bot_id: str, st: _BotState):
+        with self._lock:
+            if self.bots.get(bot_id) is not st or st.timer is None:
+                return
+            st.timer = None
+            st.next_restart = None
+            st.restarts += 1
+            self._own_starts.add(bot_id)
+        try:
+            self.reg.start(bot_id, self.reg._get(bot_id).launch)
+        except FileNotFoundError:
+            # deleted while we were waiting
+            self.forget(bot_id)
+        except Exception as e:
+            print(f"Automatic restart of {bot_id} failed: {e}")
+            self.on_exit(bot_id, None, False, 0.0)
+        finally:
+            # start() skips the "starting" event if the bot is already up
+            with self._lock:
+                self._own_starts.discard(bot_id)
+
+    def forget(self, bot_id: str):
+        with self._lock:
+            st = self.bots.pop(bot_id, None)
+            self._own_starts.discard(bot_id)
+        if st is not None:
+            st.cancel()
+
+    def state(self, bot_id: str) -> dict:
+        """Restart counters for the status snapshot."""
+        with self._lock:
+            st = self.bots.get(bot_id)
+            if st is None:
+                return {"restarts": 0, "streak": 0, "breaker": False, "next_restart": None}
+            return {
+                "restarts": st.restarts,
+                "streak": st.streak,
+                "breaker": st.breaker,
+                "next_restart": st.next_restart,
+            }
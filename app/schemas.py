@@ -8,6 +8,8 @@ class ScheduleItem(BaseModel):
     cron: Optional[str] = None    # crontab string
     every_seconds: Optional[int] = None
     custom_cmd: Optional[str] = None
+    jitter_seconds: Optional[int] = None  # spread runs over this window (default: [scheduler] jitter_seconds)
+    priority: int = 0             # higher runs first when the action queue is full
 
 class BotConfig(BaseModel, extra=Extra.allow):
     schedules: List[ScheduleItem] = Field(default_factory=list)
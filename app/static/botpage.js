@@ -7,6 +7,7 @@ let statusWS = null, logWS = null, schema = null, config = null;
 function badge(s){
   if (s==="running") return '<span class="bot-status running"><i class="fas fa-circle"></i> running</span>';
   if (s==="stopped") return '<span class="bot-status stopped"><i class="fas fa-circle"></i> stopped</span>';
+  if (s==="starting" || s==="stopping") return `<span class="bot-status stopped"><i class="fas fa-circle-notch fa-spin"></i> ${s}</span>`;
   return `<span class="bot-status error"><i class="fas fa-exclamation-circle"></i> ${s}</span>`;
 }
 
@@ -21,7 +22,14 @@ function openStatusWS(){
   statusWS = new WebSocket(`${location.origin.replace("http","ws")}/ws/status`);
   statusWS.onmessage = ev => {
     try {
-      const list = JSON.parse(ev.data);
+      // First message is a full snapshot, later ones only carry changed bots
+      const msg = JSON.parse(ev.data);
+      if (msg.type === "event") {
+        // lifecycle transition between ticks; the next diff carries the rest
+        if (msg.bot === botId) $("#bot-status").outerHTML = badge(msg.state === "exited" ? "stopped" : msg.state);
+        return;
+      }
+      const list = msg.type === "snapshot" ? msg.bots : (msg.changed || []);
       const b = list.find(x=>x.id===botId);
       if (!b) return;
       
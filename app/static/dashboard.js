@@ -1,10 +1,28 @@
 // app/static/dashboard.js
 const $ = s => document.querySelector(s);
 let ws = null, bots = [];
+const botsById = new Map();
+
+// /ws/status sends one full snapshot, then per-bot diffs
+function applyStatus(msg) {
+  if (msg.type === "snapshot") {
+    botsById.clear();
+    msg.bots.forEach(b => botsById.set(b.id, b));
+  } else if (msg.type === "diff") {
+    (msg.changed || []).forEach(b => botsById.set(b.id, b));
+    (msg.removed || []).forEach(id => botsById.delete(id));
+  } else if (msg.type === "event") {
+    // lifecycle transitions arrive between ticks
+    const b = botsById.get(msg.bot);
+    if (b) botsById.set(msg.bot, Object.assign({}, b, {status: msg.state === "exited" ? "stopped" : msg.state}));
+  }
+  bots = Array.from(botsById.values());
+}
 
 function badge(s){
   if (s==="running") return '<span class="bot-status running"><i class="fas fa-circle"></i> running</span>';
   if (s==="stopped") return '<span class="bot-status stopped"><i class="fas fa-circle"></i> stopped</span>';
+  if (s==="starting" || s==="stopping") return `<span class="bot-status stopped"><i class="fas fa-circle-notch fa-spin"></i> ${s}</span>`;
   return `<span class="bot-status error"><i class="fas fa-exclamation-circle"></i> ${s}</span>`;
 }
 
@@ -108,7 +126,7 @@ function connect(){
   ws = new WebSocket(`${location.origin.replace("http","ws")}/ws/status`);
   ws.onmessage = ev => { 
     try {
-      bots = JSON.parse(ev.data); 
+      applyStatus(JSON.parse(ev.data));
       render(); 
     } catch (error) {
       console.error("Error parsing WebSocket message", error);
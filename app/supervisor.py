@@ -0,0 +1,256 @@
+# app/supervisor.py
+import os
+import time
+import fcntl
+import select
+import signal
+import psutil
+import threading
+from typing import Dict, Optional, Tuple
+
+# How often the supervisor samples CPU/RSS for every bot (seconds)
+SAMPLE_INTERVAL = float(os.environ.get("SUPERVISOR_INTERVAL", "2.0"))
+
+
+class ProcessSupervisor:
+    """Single background thread that owns process handles for all bots.
+
+    It keeps one long-lived psutil.Process per running bot, samples CPU/RSS
+    once per interval, reaps exited children as soon as SIGCHLD arrives and
+    publishes the result as a cached snapshot that readers get for free.
+    """
+
+    def __init__(self, registry, interval: float = SAMPLE_INTERVAL):
+        self.registry = registry
+        self.interval = interval
+        self.handles: Dict[str, psutil.Process] = {}
+        self.rows: Dict[str, dict] = {}
+        # Published rows: a new tuple per publish, never modified after,
+        # so snapshot() hands it out without locking or copying
+        self._snapshot: Tuple[dict, ...] = ()
+        self.generation = 0
+        self._lock = threading.Lock()
+        # bot_id -> monotonic time at which a stopping bot gets SIGKILL
+        self.deadlines: Dict[str, float] = {}
+        # how long the last full sample() took, for /metrics
+        self.sample_seconds = 0.0
+
+        # Self-pipe: the SIGCHLD handler and wake() write a byte, the
+        # supervisor thread sleeps in select() on the read end.
+        self._rfd, self._wfd = os.pipe()
+        for fd in (self._rfd, self._wfd):
+            fl = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+        self._prev_sigchld = None
+        self._install_sigchld()
+
+        self._thread = threading.Thread(target=self._run, name="bot-supervisor", daemon=True)
+        self._thread.start()
+
+    # ---------- wakeups ----------
+    def _install_sigchld(self):
+        # Signal handlers can only be installed from the main thread; when
+        # that is not possible we still reap on every sampling interval.
+        try:
+            self._prev_sigchld = signal.signal(signal.SIGCHLD, self._on_sigchld)
+        except (ValueError, OSError):
+            self._prev_sigchld = None
+
+    def _on_sigchld(self, signum, frame):
+        self.wake()
+        prev = self._prev_sigchld
+        if callable(prev):
+            prev(signum, frame)
+
+    def wake(self):
+        try:
+            os.write(self._wfd, b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain(self):
+        try:
+            while os.read(self._rfd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    # ---------- stop escalation ----------
+    def escalate(self, bot_id: str, after: float):
+        self.deadlines[bot_id] = time.monotonic() + after
+        self.wake()
+
+    def clear_escalation(self, bot_id: str):
+        self.deadlines.pop(bot_id, None)
+
+    def _check_deadlines(self):
+        now = time.monotonic()
+        for bot_id, when in list(self.deadlines.items()):
+            if when > now:
+                continue
+            self.deadlines.pop(bot_id, None)
+            b = self.registry.bots.get(bot_id)
+            if b is not None and (b.proc is not None or b.pid):
+                self.registry._kill(b)
+
+    # ---------- loop ----------
+    def _run(self):
+        next_sample = 0.0
+        while True:
+            timeout = max(0.0, next_sample - time.monotonic())
+            if self.deadlines:
+                # Adopted PIDs raise no SIGCHLD; look more often while a
+                # stop is in flight.
+                timeout = min(timeout, 0.1)
+            # Zygote-forked bots are not our children; their exit arrives
+            # on the handle's connection instead of as SIGCHLD.
+            watch = [self._rfd] + [
+                p for p in (b.proc for b in self.registry.bots.values())
+                if p is not None and hasattr(p, "fileno") and p.returncode is None
+            ]
+            try:
+                ready, _, _ = select.select(watch, [], [], timeout)
+            except (InterruptedError, OSError, ValueError):
+                # a handle closed under us; the reap below sorts it out
+                ready = []
+            if self._rfd in ready:
+                self._drain()
+            try:
+                self.reap()
+                self._check_deadlines()
+                if time.monotonic() >= next_sample:
+                    self.sample()
+                    next_sample = time.monotonic() + self.interval
+                else:
+                    self.publish()
+            except Exception as e:
+                print(f"Supervisor error: {e}")
+
+    def reap(self):
+        """Collect exit status of any bot whose process has gone away."""
+        for bot_id, b in self.registry.bots.items():
+            proc = b.proc
+            if proc is not None:
+                # Popen.poll() does waitpid(WNOHANG) on our own child
+                code = proc.poll()
+                if code is not None:
+                    self.registry._on_exit(b, code, proc)
+            elif b.pid:
+                h = self._handle(b)
+                if h is None or not _alive(h):
+                    self.registry._on_exit(b, None, None)
+
+    def _handle(self, b) -> Optional[psutil.Process]:
+        h = self.handles.get(b.bot_id)
+        if h is not None and h.pid == b.pid:
+            return h
+        try:
+            h = psutil.Process(b.pid)
+            # prime cpu_percent so the next call measures a real interval
+            h.cpu_percent(interval=None)
+        except Exception:
+            self.handles.pop(b.bot_id, None)
+            return None
+        self.handles[b.bot_id] = h
+        return h
+
+    def sample(self):
+        """Take one CPU/RSS reading per bot and rebuild every row."""
+        started = time.perf_counter()
+        rows = {bot_id: self._row(b, sample=True) for bot_id, b in self.registry.bots.items()}
+        with self._lock:
+            self.rows.update(rows)
+            self._publish()
+        now = time.time()
+        for bot_id, row in rows.items():
+            if row["pid"] is not None:
+                self.registry.history.add(bot_id, row["cpu"], row["memory_mb"], now)
+        self.sample_seconds = time.perf_counter() - started
+
+    def refresh(self, bot_id: str):
+        """Rebuild one bot's row right away (after start/stop/create)."""
+        b = self.registry.bots.get(bot_id)
+        row = self._row(b, sample=False) if b is not None else None
+        with self._lock:
+            if row is None:
+                self.rows.pop(bot_id, None)
+            else:
+                prev = self.rows.get(bot_id)
+                if prev and row["pid"] == prev["pid"]:
+                    row["cpu"] = prev["cpu"]
+                    row["memory_mb"] = prev["memory_mb"]
+                    row["cgroup"] = prev.get("cgroup")
+                self.rows[bot_id] = row
+            self._publish()
+        self.wake()
+
+    def _row(self, b, sample: bool) -> dict:
+        running = b.pid is not None and (b.proc is None or b.proc.returncode is None)
+        cpu = 0.0
+        mem = 0.0
+        pid = None
+        cg = None
+        if running:
+            h = self._handle(b)
+            if h is None:
+                running = False
+            else:
+                pid = h.pid
+                if sample:
+                    # the bot's cgroup covers its whole process tree and
+                    # costs a few small reads; psutil is the fallback
+                    cg = self.registry.cgroups.stats(b.bot_id)
+                    if cg is not None:
+                        cpu = cg["cpu_percent"]
+                        mem = cg["memory_bytes"] / (1024 * 1024)
+                    else:
+                        try:
+                            with h.oneshot():
+                                cpu = h.cpu_percent(interval=None)
+                                mem = h.memory_info().rss / (1024 * 1024)
+                        except Exception:
+                            pass
+        else:
+            self.handles.pop(b.bot_id, None)
+
+        status = "running" if running else "stopped"
+        if running and b.status in ("starting", "stopping"):
+            status = b.status
+        return {
+            "id": b.bot_id,
+            "name": self.registry.display_name(b.bot_id),
+            "status": status,
+            "pid": pid,
+            "cpu": round(cpu, 1),
+            "memory_mb": round(mem, 1),
+            "started_at": b.started_at.isoformat() if b.started_at else None,
+            "last_exit": b.last_exit,
+            "restart": self.registry.restarts.state(b.bot_id),
+            "cgroup": cg,
+            "template": b.version,
+            "log": str(b.logfile)
+        }
+
+    def publish(self):
+        with self._lock:
+            self._publish()
+
+    def _publish(self):
+        # caller holds self._lock
+        bots = self.registry.bots   # one consistent generation of the map
+        for stale in [k for k in self.rows if k not in bots]:
+            self.rows.pop(stale, None)
+            self.handles.pop(stale, None)
+        self._snapshot = tuple(self.rows[k] for k in bots if k in self.rows)
+        self.generation += 1
+
+    def snapshot(self) -> Tuple[dict, ...]:
+        """The last published rows. Shared between readers: do not modify."""
+        return self._snapshot
+
+
+def _alive(h: psutil.Process) -> bool:
+    try:
+        return h.is_running() and h.status() != psutil.STATUS_ZOMBIE
+    except Exception:
+        return False
@@ -0,0 +1,438 @@
+# app/tailer.py
+import os
+import struct
+import asyncio
+import threading
+import ctypes
+import ctypes.util
+from collections import deque
+from typing import Dict, List, Optional
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_ROTATE_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB
+
+READ_CHUNK = 64 * 1024
+# Bytes handled per wakeup before yielding back to the event loop
+READ_BUDGET = 512 * 1024
+# Poll fallback delays (seconds): fast while data flows, slow when idle
+POLL_MIN = 0.1
+POLL_MAX = 1.0
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            _libc.inotify_init1
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc
+
+
+class Inotify:
+    """Minimal ctypes binding: one inotify fd, watching one directory or more."""
+
+    def __init__(self, directory: Optional[str] = None, mask: int = _WATCH_MASK):
+        libc = _load_libc()
+        if not libc:
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.mask = mask
+        if directory is not None:
+            try:
+                self.add(directory)
+            except OSError:
+                os.close(self.fd)
+                raise
+
+    def add(self, directory: str) -> int:
+        """Watch another directory; returns its watch descriptor."""
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(directory), self.mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+        return wd
+
+    def remove(self, wd: int):
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self) -> List[tuple]:
+        """Return pending (mask, name) events without blocking."""
+        return [(mask, name) for _wd, mask, name in self.read_events()]
+
+    def read_events(self) -> List[tuple]:
+        """Return pending (wd, mask, name) events without blocking."""
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            off = 0
+            while off + _EVENT.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+                name = buf[off + _EVENT.size: off + _EVENT.size + length].rstrip(b"\0")
+                events.append((wd, mask, os.fsdecode(name)))
+                off += _EVENT.size + length
+        return events
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class Subscription:
+    """A consumer's view of a line stream: batches of lines, no newlines.
+
+    At most max_pending_bytes of undelivered text is held; when a consumer
+    falls further behind, the oldest lines are dropped and get() reports
+    how many were skipped with a single marker line.
+    """
+
+    def __init__(self, hub=None, key=None, max_pending_bytes: int = 0):
+        self.hub = hub
+        self.key = key
+        self.max_pending_bytes = max_pending_bytes
+        self.batches = deque()
+        self.pending_bytes = 0
+        self.dropped = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def feed(self, lines: List[str]):
+        size = sum(len(line) + 1 for line in lines)
+        self.batches.append((lines, size))
+        self.pending_bytes += size
+        if self.max_pending_bytes and self.pending_bytes > self.max_pending_bytes:
+            self._shed()
+        self.ready.set()
+
+    def _shed(self):
+        # Drop whole batches from the front, then trim the oldest one
+        while self.pending_bytes > self.max_pending_bytes and len(self.batches) > 1:
+            lines, size = self.batches.popleft()
+            self.pending_bytes -= size
+            self.dropped += len(lines)
+        if self.pending_bytes > self.max_pending_bytes:
+            lines, size = self.batches.popleft()
+            keep = []
+            kept = 0
+            for line in reversed(lines):
+                if kept + len(line) + 1 > self.max_pending_bytes:
+                    break
+                keep.append(line)
+                kept += len(line) + 1
+            keep.reverse()
+            self.dropped += len(lines) - len(keep)
+            self.pending_bytes = kept
+            self.batches.appendleft((keep, kept))
+
+    def get_nowait(self) -> List[str]:
+        """Return every line delivered since the last call (maybe none)."""
+        out = []
+        if self.dropped:
+            out.append(f"[... {self.dropped} lines dropped, client too slow ...]")
+            self.dropped = 0
+        # batches are shared between subscribers, so always copy out
+        while self.batches:
+            out.extend(self.batches.popleft()[0])
+        self.pending_bytes = 0
+        return out
+
+    async def get(self) -> List[str]:
+        """Wait for and return every line delivered since the last call."""
+        while not self.batches and not self.dropped:
+            if self.closed:
+                return []
+            self.ready.clear()
+            await self.ready.wait()
+        return self.get_nowait()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.ready.set()
+            if self.hub is not None:
+                self.hub._unsubscribe(self)
+
+
+class LogTailer:
+    """Follows one file and fans new lines out to its subscribers.
+
+    Uses an inotify watch on the parent directory when available (zero
+    wakeups while the file is idle) and falls back to adaptive polling.
+    Rotation (file replaced) and truncation (file shrunk) are detected and
+    the tail restarts at the beginning of the new content.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dir = os.path.dirname(path) or "."
+        self.name = os.path.basename(path)
+        self.subscribers: List[Subscription] = []
+        self.fh = None
+        self.ino = None
+        self.pos = 0
+        self.partial = b""
+        self.lines_out = 0
+        self.task: Optional[asyncio.Task] = None
+        self._notify: Optional[Inotify] = None
+        self._changed = asyncio.Event()
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    # ---------- file handling ----------
+    def _open(self, at_end: bool) -> bool:
+        try:
+            fh = open(self.path, "rb")
+        except OSError:
+            return False
+        st = os.fstat(fh.fileno())
+        self.fh = fh
+        self.ino = (st.st_dev, st.st_ino)
+        self.pos = st.st_size if at_end else 0
+        fh.seek(self.pos)
+        self.partial = b""
+        return True
+
+    def _close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def _rotated(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_dev, st.st_ino) != self.ino
+
+    def _publish(self, lines: List[str]):
+        if not lines:
+            return
+        self.lines_out += len(lines)
+        for sub in self.subscribers:
+            sub.feed(lines)
+
+    def _split(self, data: bytes) -> List[str]:
+        # One pass over the chunk; the unterminated tail waits for more data
+        parts = (self.partial + data).split(b"\n") if self.partial else data.split(b"\n")
+        self.partial = parts.pop()
+        return [p.decode("utf-8", errors="replace") for p in parts]
+
+    async def _read_available(self):
+        """Read everything currently in the file, yielding between budgets."""
+        budget = READ_BUDGET
+        while self.fh is not None:
+            if os.fstat(self.fh.fileno()).st_size < self.pos:
+                # truncated in place (e.g. `> bot.log`)
+                self.fh.seek(0)
+                self.pos = 0
+                self.partial = b""
+            chunk = self.fh.read(READ_CHUNK)
+            if not chunk:
+                return
+            self.pos += len(chunk)
+            self._publish(self._split(chunk))
+            budget -= len(chunk)
+            if budget <= 0:
+                budget = READ_BUDGET
+                await asyncio.sleep(0)
+
+    async def _follow_rotation(self):
+        # Drain what is left in the old file, then switch to the new one
+        await self._read_available()
+        if self.partial:
+            self._publish([self.partial.decode("utf-8", errors="replace")])
+            self.partial = b""
+        self._close()
+        if self._open(at_end=False):
+            await self._read_available()
+
+    # ---------- main loop ----------
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            self._notify = Inotify(self.dir)
+            loop.add_reader(self._notify.fileno(), self._changed.set)
+        except OSError:
+            self._notify = None
+        try:
+            self._open(at_end=True)
+            delay = POLL_MIN
+            while True:
+                if self._notify is not None:
+                    await self._changed.wait()
+                    self._changed.clear()
+                    events = self._notify.read()
+                    rotate = any(
+                        (mask & IN_Q_OVERFLOW) or (name == self.name and mask & _ROTATE_MASK)
+                        for mask, name in events
+                    )
+                    touched = rotate or any(name == self.name for _mask, name in events)
+                    if not touched:
+                        continue
+                else:
+                    await asyncio.sleep(delay)
+                    rotate = self.fh is None or self._rotated()
+
+                before = self.pos
+                if self.fh is None:
+                    if self._open(at_end=False):
+                        await self._read_available()
+                elif rotate and self._rotated():
+                    await self._follow_rotation()
+                else:
+                    await self._read_available()
+                # adaptive poll: back off while the file is quiet
+                delay = POLL_MIN if self.pos != before else min(delay * 2, POLL_MAX)
+        finally:
+            if self._notify is not None:
+                try:
+                    loop.remove_reader(self._notify.fileno())
+                except Exception:
+                    pass
+                self._notify.close()
+            self._close()
+
+
+class LineRing:
+    """Fixed-size in-memory buffer of a bot's most recent output lines.
+
+    Filled from the bot's log file on the log pump thread. subscribe() hands
+    out the buffered lines and registers the subscriber under the same
+    lock the writer takes, so the live stream continues exactly where the
+    backfill ends: no gap and no duplicates.
+    """
+
+    def __init__(self, max_lines: int = 1000):
+        self.lines = deque(maxlen=max_lines)
+        self.partial = b""
+        self.seeded = False
+        self.subscribers: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def resize(self, max_lines: int):
+        with self._lock:
+            if max_lines != self.lines.maxlen:
+                self.lines = deque(self.lines, maxlen=max_lines)
+
+    def seed(self, lines: List[str]):
+        """Prefill from disk once, before any live output is appended."""
+        with self._lock:
+            if not self.seeded and not self.lines:
+                self.lines.extend(lines)
+            self.seeded = True
+
+    def feed_bytes(self, data: bytes):
+        parts = (self.partial + data).split(b"\n") if self.partial else data.split(b"\n")
+        self.partial = parts.pop()
+        if parts:
+            self.append([p.decode("utf-8", errors="replace") for p in parts])
+
+    def flush(self):
+        # EOF: an unterminated last line is still a line
+        if self.partial:
+            line = self.partial.decode("utf-8", errors="replace")
+            self.partial = b""
+            self.append([line])
+
+    def append(self, lines: List[str]):
+        with self._lock:
+            self.seeded = True
+            self.lines.extend(lines)
+            subs = list(self.subscribers)
+        if subs:
+            # counted like a tailer's: once per batch, not per subscriber
+            hub.ring_lines += len(lines)
+        for sub, loop in subs:
+            try:
+                loop.call_soon_threadsafe(sub.feed, lines)
+            except RuntimeError:
+                # event loop is gone
+                self._unsubscribe(sub)
+
+    def subscribe(self, max_pending_bytes: int = 0):
+        """Return (backfill_lines, subscription); call from the event loop."""
+        sub = Subscription(self, None, max_pending_bytes)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            backfill = list(self.lines)
+            self.subscribers.append((sub, loop))
+        return backfill, sub
+
+    def _unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self.subscribers = [(s, lp) for s, lp in self.subscribers if s is not sub]
+
+
+class TailHub:
+    """Shares one LogTailer per file between all interested websockets."""
+
+    def __init__(self):
+        self.tailers: Dict[str, LogTailer] = {}
+        # lines published by tailers that have since been stopped
+        self._retired_lines = 0
+        # lines LineRings passed to live subscribers (bumped on the log pump thread)
+        self.ring_lines = 0
+
+    @property
+    def lines_out(self) -> int:
+        """Lines fanned out to log followers so far, by tailers and rings."""
+        return self._retired_lines + self.ring_lines + sum(t.lines_out for t in list(self.tailers.values()))
+
+    def subscribe(self, path: str, max_pending_bytes: int = 0) -> Subscription:
+        key = os.path.abspath(path)
+        tailer = self.tailers.get(key)
+        if tailer is None:
+            tailer = LogTailer(key)
+            self.tailers[key] = tailer
+            tailer.start()
+        sub = Subscription(self, key, max_pending_bytes)
+        tailer.subscribers.append(sub)
+        return sub
+
+    def _unsubscribe(self, sub: Subscription):
+        tailer = self.tailers.get(sub.key)
+        if tailer is None:
+            return
+        if sub in tailer.subscribers:
+            tailer.subscribers.remove(sub)
+        if not tailer.subscribers:
+            tailer.stop()
+            self.tailers.pop(sub.key, None)
+            self._retired_lines += tailer.lines_out
+
+
+hub = TailHub()
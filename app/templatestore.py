@@ -0,0 +1,147 @@
+# app/templatestore.py
+import os
+import re
+import stat
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .provision import template_files
+
+# Length of the hex content hash used as a version name
+VERSION_CHARS = 16
+VERSION_RE = re.compile(r"^[0-9a-f]{%d}$" % VERSION_CHARS)
+
+
+def is_version(name) -> bool:
+    """True if `name` looks like a version this store produces."""
+    return isinstance(name, str) and VERSION_RE.match(name) is not None
+
+
+class TemplateStore:
+    """Content-addressed, read-only copies of a template's code.
+
+    A version is named by the hash of every file's path, mode and bytes
+    (config.toml and __pycache__ excluded, as in provisioning), so the
+    same code is stored once however often it is snapshotted. Version
+    directories are never modified after they are written; instances
+    point at one through their `template` symlink.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        # (template, stat signature) -> version, so unchanged templates are not rehashed
+        self._known: Dict[Tuple[str, tuple], str] = {}
+        self._layouts: Dict[str, Tuple[List[str], List[str]]] = {}
+
+    def path(self, version: str) -> Path:
+        return self.root / version
+
+    def exists(self, version: str) -> bool:
+        return is_version(version) and (self.root / version).is_dir()
+
+    def layout(self, version: str) -> Tuple[List[str], List[str]]:
+        """(subdirectories, files) of a stored version; cached, since versions never change."""
+        with self._lock:
+            cached = self._layouts.get(version)
+        if cached is None:
+            if not self.exists(version):
+                raise FileNotFoundError(f"template version {version}")
+            cached = template_files(self.path(version))
+            with self._lock:
+                self._layouts[version] = cached
+        return cached
+
+    def version_of(self, template: Path) -> str:
+        """Hash of the template as it is on disk now (nothing is stored)."""
+        layout = template_files(template)
+        sig = tuple(_stat_sig(template, rel) for rel in sorted(layout[1]))
+        key = (str(template), sig)
+        with self._lock:
+            version = self._known.get(key)
+        if version is None:
+            h = hashlib.sha256()
+            for rel in sorted(layout[1]):
+                p = os.path.join(template, rel)
+                h.update(rel.encode() + b"\0")
+                h.update(b"x" if os.access(p, os.X_OK) else b"-")
+                with open(p, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        h.update(chunk)
+                h.update(b"\0")
+            version = h.hexdigest()[:VERSION_CHARS]
+            with self._lock:
+                self._known[key] = version
+        return version
+
+    def snapshot(self, template: Path) -> str:
+        """Store the template's current code if it is new; returns its version."""
+        version = self.version_of(template)
+        dest = self.path(version)
+        if dest.is_dir():
+            return version
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.root / f".tmp-{version}-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        dirs, files = template_files(template)
+        os.mkdir(tmp)
+        for d in dirs:
+            os.makedirs(tmp / d, exist_ok=True)
+        for rel in files:
+            shutil.copy2(os.path.join(template, rel), tmp / rel)
+            _readonly(tmp / rel)
+        try:
+            os.rename(tmp, dest)
+        except OSError:
+            # another snapshot of the same code won the race
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not dest.is_dir():
+                raise
+            return version
+        for d in sorted(dirs, key=len, reverse=True) + ["."]:
+            _readonly(dest / d)
+        return version
+
+    def versions(self) -> List[dict]:
+        if not self.root.is_dir():
+            return []
+        out = []
+        for p in self.root.iterdir():
+            if p.is_dir() and is_version(p.name):
+                out.append({"version": p.name, "created_at": p.stat().st_mtime})
+        out.sort(key=lambda v: v["created_at"])
+        return out
+
+    def prune(self, keep) -> List[str]:
+        """Delete stored versions not in `keep`; returns what was removed."""
+        removed = []
+        for v in self.versions():
+            version = v["version"]
+            if version in keep:
+                continue
+            path = self.path(version)
+            # directories were made read-only; unlinking needs them writable
+            for root, dnames, _ in os.walk(path):
+                os.chmod(root, 0o755)
+                for d in dnames:
+                    os.chmod(os.path.join(root, d), 0o755)
+            shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self._layouts.pop(version, None)
+                for k in [k for k, val in self._known.items() if val == version]:
+                    self._known.pop(k, None)
+            removed.append(version)
+        return removed
+
+
+def _stat_sig(template: Path, rel: str) -> tuple:
+    st = os.stat(os.path.join(template, rel))
+    return (rel, st.st_size, st.st_mtime_ns, st.st_mode)
+
+
+def _readonly(path: Path):
+    mode = os.stat(path).st_mode
+    os.chmod(path, stat.S_IMODE(mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
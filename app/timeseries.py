@@ -0,0 +1,212 @@
+# app/timeseries.py
+import os
+import re
+import time
+import struct
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+from .utils import atomic_write
+
+# (bucket seconds, buckets kept): 10 min of 1 s, 24 h of 1 min, 30 d of 1 h
+LEVELS = ((1, 600), (60, 1440), (3600, 720))
+# How often changed series are written to disk (seconds)
+PERSIST_INTERVAL = 300.0
+FILE_NAME = "metrics.ts"
+_MAGIC = b"BMTS1"
+
+_RANGE_RE = re.compile(r"^(\d+)([smhd]?)$")
+_UNIT = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_range(value: str) -> int:
+    """'90s' / '15m' / '24h' / '7d' (or plain seconds) -> seconds."""
+    m = _RANGE_RE.match(value.strip().lower())
+    if not m:
+        raise ValueError(f"bad range: {value}")
+    return int(m.group(1)) * _UNIT[m.group(2)]
+
+
+class _Level:
+    """Fixed ring of buckets; a bucket is reused once its slot comes round."""
+
+    def __init__(self, step: int, size: int):
+        self.step = step
+        self.size = size
+        self.slot = array("q", [-1]) * size   # bucket number held by each index
+        self.n = array("I", [0]) * size
+        self.cpu_sum = array("f", [0.0]) * size
+        self.cpu_max = array("f", [0.0]) * size
+        self.mem_sum = array("f", [0.0]) * size
+        self.mem_max = array("f", [0.0]) * size
+
+    def arrays(self):
+        return (self.slot, self.n, self.cpu_sum, self.cpu_max, self.mem_sum, self.mem_max)
+
+    def add(self, t: float, cpu: float, mem: float):
+        bucket = int(t // self.step)
+        i = bucket % self.size
+        if self.slot[i] != bucket:
+            self.slot[i] = bucket
+            self.n[i] = 0
+            self.cpu_sum[i] = self.cpu_max[i] = 0.0
+            self.mem_sum[i] = self.mem_max[i] = 0.0
+        self.n[i] += 1
+        self.cpu_sum[i] += cpu
+        self.mem_sum[i] += mem
+        if cpu > self.cpu_max[i]:
+            self.cpu_max[i] = cpu
+        if mem > self.mem_max[i]:
+            self.mem_max[i] = mem
+
+    def query(self, start: float, end: float, group: int) -> List[list]:
+        """[ts, cpu_avg, cpu_max, mem_avg, mem_max] per `group` buckets."""
+        first = int(start // self.step)
+        last = int(end // self.step)
+        first = max(first, last - self.size + 1)
+        out = []
+        b = first - first % group
+        while b <= last:
+            n = 0
+            cs = ms = cm = mm = 0.0
+            for bucket in range(b, b + group):
+                i = bucket % self.size
+                if bucket < first or bucket > last or self.slot[i] != bucket:
+                    continue
+                n += self.n[i]
+                cs += self.cpu_sum[i]
+                ms += self.mem_sum[i]
+                cm = max(cm, self.cpu_max[i])
+                mm = max(mm, self.mem_max[i])
+            if n:
+                out.append([b * self.step, round(cs / n, 2), round(cm, 2),
+                            round(ms / n, 2), round(mm, 2)])
+            b += group
+        return out
+
+
+class Series:
+    """CPU/memory history of one bot at every resolution in LEVELS."""
+
+    def __init__(self):
+        self.levels = [_Level(step, size) for step, size in LEVELS]
+        self.dirty = False
+
+    def add(self, t: float, cpu: float, mem: float):
+        for lvl in self.levels:
+            lvl.add(t, cpu, mem)
+        self.dirty = True
+
+    def to_bytes(self) -> bytes:
+        parts = [_MAGIC, struct.pack("<I", len(self.levels))]
+        for lvl in self.levels:
+            parts.append(struct.pack("<II", lvl.step, lvl.size))
+            parts.extend(a.tobytes() for a in lvl.arrays())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Series":
+        s = cls()
+        if not data.startswith(_MAGIC):
+            raise ValueError("not a metrics file")
+        pos = len(_MAGIC)
+        (count,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        for lvl in s.levels[:count]:
+            step, size = struct.unpack_from("<II", data, pos)
+            pos += 8
+            if (step, size) != (lvl.step, lvl.size):
+                # layout changed since it was written; start this bot fresh
+                raise ValueError("metrics layout changed")
+            for a in lvl.arrays():
+                nbytes = a.itemsize * size
+                a[:] = array(a.typecode, data[pos:pos + nbytes])
+                pos += nbytes
+        return s
+
+
+class MetricsHistory:
+    """Per-bot Series, fed by the supervisor and saved next to each bot.
+
+    Memory per bot is fixed: sum(size for LEVELS) buckets of six numbers.
+    """
+
+    def __init__(self, registry, interval: float = PERSIST_INTERVAL):
+        self.reg = registry
+        self.interval = interval
+        self.series: Dict[str, Series] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="metrics-history", daemon=True)
+        self._thread.start()
+
+    def _path(self, bot_id: str) -> Optional[str]:
+        b = self.reg.bots.get(bot_id)
+        return str(b.path / FILE_NAME) if b is not None else None
+
+    def _get(self, bot_id: str) -> Series:
+        # caller holds self._lock
+        s = self.series.get(bot_id)
+        if s is None:
+            s = Series()
+            path = self._path(bot_id)
+            if path and os.path.exists(path):
+                try:
+                    with open(path, "rb") as f:
+                        s = Series.from_bytes(f.read())
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Ignoring metrics history for {bot_id}: {e}")
+            self.series[bot_id] = s
+        return s
+
+    def add(self, bot_id: str, cpu: float, mem_mb: float, t: Optional[float] = None):
+        t = time.time() if t is None else t
+        with self._lock:
+            self._get(bot_id).add(t, cpu, mem_mb)
+
+    def query(self, bot_id: str, seconds: int, points: int = 0) -> dict:
+        """Downsampled history for the last `seconds`.
+
+        Uses the finest level that still covers the range; `points` caps
+        the number of returned points by merging neighbouring buckets.
+        """
+        end = time.time()
+        level = next((i for i, (step, size) in enumerate(LEVELS) if step * size >= seconds),
+                     len(LEVELS) - 1)
+        with self._lock:
+            lvl = self._get(bot_id).levels[level]
+            buckets = min(seconds // lvl.step + 1, lvl.size)
+            group = max(1, -(-buckets // points)) if points > 0 else 1
+            data = lvl.query(end - seconds, end, group)
+        return {
+            "bot": bot_id,
+            "step": lvl.step * group,
+            "fields": ["ts", "cpu_avg", "cpu_max", "memory_mb_avg", "memory_mb_max"],
+            "points": data,
+        }
+
+    def forget(self, bot_id: str):
+        with self._lock:
+            self.series.pop(bot_id, None)
+
+    def save(self):
+        with self._lock:
+            dirty = [(b, s.to_bytes()) for b, s in self.series.items() if s.dirty]
+            for b, _ in dirty:
+                self.series[b].dirty = False
+        for bot_id, data in dirty:
+            path = self._path(bot_id)
+            if not path:
+                continue
+            try:
+                atomic_write(path, data)
+            except OSError as e:
+                print(f"Could not save metrics history for {bot_id}: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Metrics history save failed: {e}")
@@ -1,30 +1,58 @@
 # app/utils.py
 import os
-import time
-import asyncio
+import tempfile
 from typing import AsyncGenerator
 
+from .tailer import hub
+
 def assure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-# Async tail - works well with FastAPI websockets without blocking the loop
+# Readers see either the old file or the new one, never a partial write.
+# Every call gets its own temp file, so concurrent writers of one path
+# cannot replace each other's half-written data.
+def atomic_write(path, data: bytes):
+    path = os.fspath(path)
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                               dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            # mkstemp creates 0600; keep the mode the file had
+            try:
+                os.fchmod(f.fileno(), os.stat(path).st_mode & 0o7777)
+            except FileNotFoundError:
+                os.fchmod(f.fileno(), 0o644)
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+# Async tail - works well with FastAPI websockets without blocking the loop.
+# Backed by the shared inotify tailer, so every caller watching the same
+# file shares one reader.
 async def tail_f(path: str) -> AsyncGenerator[str, None]:
-    print(f"Starting to tail file: {path}")  # Debug log
-    while not os.path.exists(path):
-        print(f"Waiting for file to exist: {path}")  # Debug log
-        await asyncio.sleep(0.2)
-    
-    print(f"File exists, starting to read: {path}")  # Debug log
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        f.seek(0, os.SEEK_END)
-        buf = ""
+    sub = hub.subscribe(path)
+    try:
+        while True:
+            lines = await sub.get()
+            for line in lines:
+                yield line + "\n"
+    finally:
+        sub.close()
+
+# Resolves once the client side of a websocket goes away; lets send-only
+# endpoints notice disconnects while they have nothing to send.
+async def wait_disconnect(ws) -> None:
+    try:
         while True:
-            chunk = f.read()
-            if chunk:
-                print(f"Read chunk of {len(chunk)} bytes")  # Debug log
-                buf += chunk
-                while "\n" in buf:
-                    line, buf = buf.split("\n", 1)
-                    yield line + "\n"
-            else:
-                await asyncio.sleep(0.2)
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                return
+    except Exception:
+        return
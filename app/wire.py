@@ -0,0 +1,176 @@
+# app/wire.py
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+try:
+    import msgpack
+except ImportError:
+    # optional: pip install msgpack
+    msgpack = None
+
+# ?format= values for /ws/status and /ws/logs; json is the default
+FORMATS = ("json", "msgpack", "binary")
+
+STATUS_CODES = ("stopped", "starting", "running", "stopping")
+# Sent once per bot (and again only if one of them changes)
+STATIC_FIELDS = ("id", "name", "log", "template")
+# Sent per tick; bit i of a change mask is FIELDS[i]
+FIELDS = ("status", "pid", "cpu", "memory_mb", "started_at", "last_exit", "restarts")
+# Changes of these are sent as the difference to the previous value
+DELTA_FIELDS = ("cpu", "memory_mb", "restarts")
+# cpu and memory_mb travel as integers in tenths
+SCALE = 10
+
+FULL, DIFF = 0, 1
+
+# binary layout, little-endian
+_FIELD_FMT = {"status": "B", "pid": "I", "cpu": "i", "memory_mb": "i",
+              "started_at": "I", "last_exit": "i", "restarts": "i"}
+_STATE = struct.Struct("<I" + "".join(_FIELD_FMT[f] for f in FIELDS))
+# last_exit "unknown" in binary frames
+NONE_I32 = -2 ** 31
+
+
+def negotiate(requested: Optional[str]) -> str:
+    """The format a client gets for ?format=; msgpack needs the package."""
+    fmt = (requested or "json").lower()
+    if fmt not in FORMATS:
+        return "json"
+    if fmt == "msgpack" and msgpack is None:
+        return "binary"
+    return fmt
+
+
+def hello(fmt: str) -> str:
+    """First (text) frame on a compact stream: everything that never changes."""
+    return json.dumps({
+        "type": "hello",
+        "format": fmt,
+        "static": STATIC_FIELDS,
+        "fields": FIELDS,
+        "deltas": DELTA_FIELDS,
+        "status_codes": STATUS_CODES,
+        "scale": {"cpu": SCALE, "memory_mb": SCALE},
+    })
+
+
+def _static(row: dict) -> tuple:
+    return (row["id"], row.get("name") or "", row.get("log") or "", row.get("template") or "")
+
+
+def _values(row: dict) -> tuple:
+    status = row.get("status")
+    started = row.get("started_at")
+    if started:
+        # started_at is naive UTC
+        started = int(datetime.fromisoformat(started).replace(tzinfo=timezone.utc).timestamp())
+    restart = row.get("restart") or {}
+    return (
+        STATUS_CODES.index(status) if status in STATUS_CODES else 0,
+        row.get("pid") or 0,
+        int(round((row.get("cpu") or 0) * SCALE)),
+        int(round((row.get("memory_mb") or 0) * SCALE)),
+        started or 0,
+        row.get("last_exit"),
+        restart.get("restarts", 0),
+    )
+
+
+_DELTA_AT = tuple(f in DELTA_FIELDS for f in FIELDS)
+
+
+class CompactStatus:
+    """What compact subscribers have been told, shared by all of them.
+
+    Bot IDs are interned to small integers on first sight (never reused).
+    update() turns a new set of status rows into one diff: definitions
+    for new bots or changed static fields, a change mask plus values per
+    changed bot (deltas for DELTA_FIELDS) and removed indices.
+    """
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self._next = 0
+        self.static: Dict[str, tuple] = {}
+        self.values: Dict[str, tuple] = {}
+
+    def _idx(self, bot_id: str) -> int:
+        i = self.index.get(bot_id)
+        if i is None:
+            i = self.index[bot_id] = self._next
+            self._next += 1
+        return i
+
+    def full(self) -> list:
+        defs = [[self.index[b], *st] for b, st in self.static.items()]
+        states = [[self.index[b], *v] for b, v in self.values.items()]
+        return [FULL, defs, states]
+
+    def update(self, rows: Dict[str, dict]) -> Optional[list]:
+        """Apply new rows; returns the diff, or None if nothing changed."""
+        defs, changes = [], []
+        for bot_id, row in rows.items():
+            i = self._idx(bot_id)
+            st = _static(row)
+            if self.static.get(bot_id) != st:
+                self.static[bot_id] = st
+                defs.append([i, *st])
+            new = _values(row)
+            old = self.values.get(bot_id)
+            if old == new:
+                continue
+            self.values[bot_id] = new
+            mask, vals = 0, []
+            for n, (v, o, delta) in enumerate(zip(new, old or (None,) * len(new), _DELTA_AT)):
+                if old is not None and v == o:
+                    continue
+                mask |= 1 << n
+                vals.append(v - o if delta and old is not None else v)
+            changes.append([i, mask, *vals])
+        gone = [b for b in self.static if b not in rows]
+        removed = [self.index.pop(b) for b in gone]
+        for b in gone:
+            self.static.pop(b, None)
+            self.values.pop(b, None)
+        if not defs and not changes and not removed:
+            return None
+        return [DIFF, defs, changes, removed]
+
+
+def encode(msg: list, fmt: str) -> bytes:
+    """Pack a full or diff message as msgpack or the fixed binary layout."""
+    if fmt == "msgpack":
+        return msgpack.packb(msg)
+    kind, defs = msg[0], msg[1]
+    out = [struct.pack("<BI", kind, len(defs))]
+    for i, *strings in defs:
+        out.append(struct.pack("<I", i))
+        for s in strings:
+            b = s.encode("utf-8")
+            out.append(struct.pack("<H", len(b)) + b)
+    if kind == FULL:
+        states = msg[2]
+        out.append(struct.pack("<I", len(states)))
+        for i, *v in states:
+            v[5] = NONE_I32 if v[5] is None else v[5]
+            out.append(_STATE.pack(i, *v))
+        out.append(struct.pack("<I", 0))
+    else:
+        changes, removed = msg[2], msg[3]
+        out.append(struct.pack("<I", len(changes)))
+        for i, mask, *vals in changes:
+            fmt_ = "<IB" + "".join(_FIELD_FMT[f] for n, f in enumerate(FIELDS) if mask >> n & 1)
+            vals = [NONE_I32 if v is None else v for v in vals]
+            out.append(struct.pack(fmt_, i, mask, *vals))
+        out.append(struct.pack("<I", len(removed)))
+        out.append(struct.pack(f"<{len(removed)}I", *removed))
+    return b"".join(out)
+
+
+def encode_lines(lines: List[str], fmt: str) -> bytes:
+    """One /ws/logs frame: a msgpack array of lines, or the raw UTF-8 text."""
+    if fmt == "msgpack":
+        return msgpack.packb(lines)
+    return "\n".join(lines).encode("utf-8", "replace")
@@ -0,0 +1,348 @@
+# app/zygote.py
+import os
+import ast
+import sys
+import json
+import time
+import errno
+import select
+import signal
+import socket
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# How long the manager waits for a fresh zygote to start listening
+BOOT_TIMEOUT = 30.0
+# Size of the spawn request (cwd, env, argv) the zygote will accept
+MAX_REQUEST = 1024 * 1024
+
+
+class ZygoteChild:
+    """Popen-like handle for a bot forked by the zygote.
+
+    The bot is the zygote's child, not ours, so its exit status arrives as
+    an "exit <code>" line on the connection that requested the spawn.
+    fileno() lets the supervisor select() on that connection.
+    """
+
+    def __init__(self, pid: int, conn: socket.socket):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self._conn = conn
+        self._buf = b""
+        self._lock = threading.Lock()
+
+    def fileno(self) -> int:
+        return self._conn.fileno()
+
+    def poll(self) -> Optional[int]:
+        with self._lock:
+            if self.returncode is not None:
+                return self.returncode
+            while True:
+                try:
+                    data = self._conn.recv(4096, socket.MSG_DONTWAIT)
+                except (BlockingIOError, InterruptedError):
+                    return None
+                except OSError:
+                    data = b""
+                if not data:
+                    # Zygote went away without reporting; all we can tell
+                    # is whether the process is still there.
+                    if _pid_alive(self.pid):
+                        return None
+                    self._finish(-1)
+                    return self.returncode
+                self._buf += data
+                if b"\n" in self._buf:
+                    line = self._buf.split(b"\n", 1)[0].decode()
+                    self._finish(int(line.split()[1]))
+                    return self.returncode
+
+    def _finish(self, code: int):
+        self.returncode = code
+        try:
+            self._conn.close()
+        except OSError:
+            pass
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                raise subprocess.TimeoutExpired("bot.py", timeout)
+            try:
+                select.select([self._conn], [], [], min(left or 1.0, 1.0))
+            except (OSError, ValueError):
+                time.sleep(0.05)
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        if self.poll() is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class Zygote:
+    """Manager side of a warm interpreter for one template.
+
+    The zygote process imports every module bot.py imports at top level,
+    then forks a child per bot on request. Children share the imported
+    modules copy-on-write and skip interpreter start-up entirely.
+    """
+
+    def __init__(self, template: Path):
+        self.template = Path(template)
+        self.sock_path = os.path.join(
+            tempfile.gettempdir(), f"bot-manager-zygote-{os.getpid()}-{self.template.name}.sock")
+        self.proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self):
+        # caller holds self._lock
+        if self.proc is not None and self.proc.poll() is None:
+            return
+        try:
+            os.unlink(self.sock_path)
+        except OSError:
+            pass
+        # stdin is never written; the zygote exits when it hits EOF, i.e.
+        # when the manager goes away
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self.sock_path, str(self.template / "bot.py")],
+            stdin=subprocess.PIPE,
+        )
+        deadline = time.monotonic() + BOOT_TIMEOUT
+        while not os.path.exists(self.sock_path):
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"zygote exited with {self.proc.returncode}")
+            if time.monotonic() > deadline:
+                self.proc.kill()
+                raise RuntimeError("zygote did not come up")
+            time.sleep(0.02)
+
+    def spawn(self, argv: List[str], cwd, env: Dict[str, str], stdout: int) -> ZygoteChild:
+        """Fork a bot with stdout/stderr on the fd `stdout` (the caller keeps its copy)."""
+        with self._lock:
+            self._ensure()
+        req = json.dumps({"argv": argv, "cwd": str(cwd), "env": env}).encode()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.sock_path)
+            socket.send_fds(conn, [req], [stdout])
+            conn.shutdown(socket.SHUT_WR)
+            reply = b""
+            while b"\n" not in reply:
+                chunk = conn.recv(64)
+                if not chunk:
+                    raise RuntimeError("zygote closed the connection")
+                reply += chunk
+        except Exception:
+            conn.close()
+            raise
+        line, rest = reply.split(b"\n", 1)
+        kind, value = line.decode().split()
+        if kind != "pid":
+            conn.close()
+            raise RuntimeError(f"zygote spawn failed: {value}")
+        child = ZygoteChild(int(value), conn)
+        child._buf = rest
+        return child
+
+    def close(self):
+        with self._lock:
+            if self.proc is not None and self.proc.poll() is None:
+                self.proc.terminate()
+            self.proc = None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# ---------- zygote process ----------
+
+def _top_level_imports(script: str) -> List[str]:
+    """Module names imported at the top of a script."""
+    with open(script, "rb") as f:
+        tree = ast.parse(f.read(), script)
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+        elif isinstance(node, ast.Try):
+            # try: import tomllib / except: import tomli
+            for sub in node.body + [s for h in node.handlers for s in h.body]:
+                if isinstance(sub, ast.Import):
+                    names.extend(a.name for a in sub.names)
+    return names
+
+
+def _preload(script: str):
+    for name in _top_level_imports(script):
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+
+def _exec_child(req: dict, fd: int):
+    """Runs in the forked child; never returns."""
+    code = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        for sig in (signal.SIGCHLD, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        os.chdir(req["cwd"])
+        os.environ.clear()
+        os.environ.update(req["env"])
+        if os.environ.get("PYTHONUNBUFFERED"):
+            sys.stdout.reconfigure(line_buffering=True)
+        sys.argv = list(req["argv"][1:])
+        sys.path[0] = req["cwd"]
+        import runpy
+        try:
+            runpy.run_path(sys.argv[0], run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(code & 0xFF)
+
+
+def serve(sock_path: str, script: str):
+    _preload(script)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(sock_path + ".tmp")
+    listener.listen(64)
+    # appear atomically so the manager never connects to a half-bound socket
+    os.replace(sock_path + ".tmp", sock_path)
+
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    conns: Dict[int, socket.socket] = {}  # child pid -> requesting connection
+    stdin = sys.stdin.fileno()
+    try:
+        while True:
+            try:
+                ready, _, _ = select.select([listener, wake_r, stdin], [], [])
+            except InterruptedError:
+                continue
+            if stdin in ready and not os.read(stdin, 4096):
+                return
+            if wake_r in ready:
+                try:
+                    while os.read(wake_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                _reap(conns)
+            if listener in ready:
+                _accept(listener, conns, [listener.fileno(), wake_r, wake_w])
+    finally:
+        try:
+            os.unlink(sock_path)
+        except OSError:
+            pass
+
+
+def _accept(listener: socket.socket, conns: Dict[int, socket.socket], own_fds: List[int]):
+    conn, _ = listener.accept()
+    try:
+        data, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST, 1)
+        while True:
+            more = conn.recv(65536)
+            if not more:
+                break
+            data += more
+        req = json.loads(data)
+        if len(fds) != 1:
+            raise ValueError("expected one stdout fd")
+    except Exception as e:
+        _send(conn, f"error {type(e).__name__}\n")
+        conn.close()
+        return
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        for fd in own_fds + [conn.fileno()] + [c.fileno() for c in conns.values()]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        _exec_child(req, fds[0])
+    os.close(fds[0])
+    conns[pid] = conn
+    _send(conn, f"pid {pid}\n")
+
+
+def _reap(conns: Dict[int, socket.socket]):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = conns.pop(pid, None)
+        if conn is not None:
+            _send(conn, f"exit {os.waitstatus_to_exitcode(status)}\n")
+            conn.close()
+
+
+def _send(conn: socket.socket, msg: str):
+    try:
+        conn.sendall(msg.encode())
+    except OSError as e:
+        # the manager side is gone; nothing to report to
+        if e.errno not in (errno.EPIPE, errno.ECONNRESET):
+            print(f"zygote: send failed: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.argv[2])
@@ -1,7 +1,9 @@
+import os
 import time
 import json
 import random
 import logging
+import logging.handlers
 import requests
 import sqlite3
 import threading
@@ -47,13 +49,19 @@ STORE      = CFG["storage"]
 DEBUG_LOG  = STORE["debug_log_file"]
 AI_LOG     = STORE["ai_log_file"]
 DB_FILE    = STORE["db_file"]
+LOG_MAX_BYTES = int(STORE.get("log_max_bytes", 5 * 1024 * 1024))
+LOG_BACKUPS   = int(STORE.get("log_backups", 3))
 MAX_HIST   = int(MEM_CFG["max_history_per_channel"])
 
 # ====== Logging ======
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler(DEBUG_LOG, encoding="utf-8")]
+    handlers=[
+        logging.StreamHandler(),
+        logging.handlers.RotatingFileHandler(DEBUG_LOG, maxBytes=LOG_MAX_BYTES,
+                                             backupCount=LOG_BACKUPS, encoding="utf-8")
+    ]
 )
 log = logging.getLogger("discum-bestfriend")
 
@@ -64,6 +72,18 @@ def log_ai(prompt, raw_response, final_reply):
         "raw_gemini": raw_response,
         "final_reply": final_reply
     }
+    # Same size cap as the debug log: ai_log.txt -> ai_log.txt.1 -> ...
+    try:
+        if os.path.getsize(AI_LOG) >= LOG_MAX_BYTES:
+            for i in range(LOG_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{AI_LOG}.{i}"):
+                    os.replace(f"{AI_LOG}.{i}", f"{AI_LOG}.{i + 1}")
+            if LOG_BACKUPS > 0:
+                os.replace(AI_LOG, f"{AI_LOG}.1")
+            else:
+                os.remove(AI_LOG)
+    except OSError:
+        pass
     with open(AI_LOG, "a", encoding="utf-8") as f:
         f.write(json.dumps(rec, ensure_ascii=False) + "\n")
 